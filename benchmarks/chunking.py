@@ -0,0 +1,107 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Compares chunking throughput of the batched chunk_text against the previous
+one-insert_one-per-chunk loop.
+
+Writes to a scratch database, which is dropped afterwards.
+
+Usage (from the repository root):
+    python -m benchmarks.chunking --mongo-uri mongodb://localhost:27017 --words 2000000
+    python -m benchmarks.chunking --mongomock
+"""
+import argparse
+import json
+import logging
+import random
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from chunking import chunk_text, ensure_chunk_indexes
+
+
+def legacy_chunk_text(text, file_id, collection, chunk_size=512, metadata=None):
+    """The per-insert loop chunk_text used before batching, kept as a baseline."""
+    words = text.split()
+    total_words = len(words)
+    inserted_chunk_ids = []
+    for i in range(0, total_words, chunk_size):
+        chunk_document = {
+            "file_id": file_id,
+            "chunk_index": i // chunk_size,
+            "chunk_text": ' '.join(words[i:i + chunk_size]),
+            "start_word_index": i,
+            "end_word_index": min(i + chunk_size, total_words),
+            "created_at": datetime.utcnow(),
+            "metadata": metadata or {},
+        }
+        result = collection.insert_one(chunk_document)
+        inserted_chunk_ids.append(result.inserted_id)
+        logging.info(f"Chunk {chunk_document['chunk_index']} saved to MongoDB.")
+    return inserted_chunk_ids
+
+
+def synthetic_text(words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def measure(name, fn):
+    start = time.perf_counter()
+    chunk_ids = fn()
+    elapsed = time.perf_counter() - start
+    return {
+        "method": name,
+        "chunks": len(chunk_ids),
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(len(chunk_ids) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking throughput benchmark.")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory mongomock client.")
+    parser.add_argument("--words", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+
+        client = MongoClient(args.mongo_uri)
+    database_name = f"chunking_benchmark_{ObjectId()}"
+    collection = client[database_name]["chunks"]
+    ensure_chunk_indexes(collection)
+    # The old loop logged every chunk at INFO; keep that cost in the baseline
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+
+    text = synthetic_text(args.words)
+    try:
+        results = [
+            measure("insert_one loop", lambda: legacy_chunk_text(
+                text, ObjectId(), collection, args.chunk_size
+            )),
+            measure(f"insert_many batches of {args.batch_size}", lambda: chunk_text(
+                text, ObjectId(), args.chunk_size,
+                batch_size=args.batch_size, collection=collection,
+            )),
+        ]
+    finally:
+        client.drop_database(database_name)
+
+    results[1]["speedup"] = round(
+        results[1]["chunks_per_second"] / results[0]["chunks_per_second"], 2
+    )
+    print(json.dumps({"words": args.words, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
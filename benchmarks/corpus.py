@@ -0,0 +1,153 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Generates a synthetic corpus of PDF, DOCX and TXT documents for benchmarks.
+
+Documents are paragraphs of railway-incident prose built from a fixed
+vocabulary. Every document has different text, so uploads are not
+deduplicated, and the same seed always produces the same corpus.
+
+Usage (from the repository root):
+    python -m benchmarks.corpus --output-dir corpus/ --documents 30 --words 3000
+"""
+import argparse
+import json
+import os
+import random
+
+import docx
+import fitz
+
+SUBJECTS = (
+    "Network Rail", "The signaller", "The driver", "The maintenance team",
+    "The station manager", "The freight operator", "The safety engineer",
+    "The control centre", "The track inspector", "The passenger operator",
+)
+VERBS = (
+    "reported", "inspected", "repaired", "delayed", "cleared", "closed",
+    "reopened", "recorded", "escalated", "investigated",
+)
+OBJECTS = (
+    "signal SN45", "the points at Reading West", "platform 4 at Paddington",
+    "the level crossing near Slough", "the overhead line equipment",
+    "the 07:42 service to Bristol", "track circuit TC112", "the depot at Old Oak",
+    "the junction at Didcot", "the freight loop at Hayes",
+)
+DETAILS = (
+    "after a points failure", "during the morning peak", "following a trespass incident",
+    "because of a broken rail", "ahead of the timetable change", "in heavy rain",
+    "after a signal passed at danger", "while engineering work overran",
+    "before the line speed was restored", "on the instructions of the duty manager",
+)
+
+
+def synthetic_paragraphs(rng, words):
+    """Returns paragraphs of three to eight sentences totalling about ``words`` words."""
+    paragraphs = []
+    count = 0
+    while count < words:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            sentence = (
+                f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} "
+                f"{rng.choice(DETAILS)} at {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}."
+            )
+            sentences.append(sentence)
+            count += len(sentence.split())
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def write_txt(path, paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+
+def write_docx(path, paragraphs):
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_pdf(path, paragraphs, paragraphs_per_page=5):
+    doc = fitz.open()
+    for start in range(0, len(paragraphs), paragraphs_per_page):
+        page = doc.new_page()
+        page.insert_textbox(
+            page.rect + (36, 36, -36, -36),
+            "\n\n".join(paragraphs[start:start + paragraphs_per_page]),
+            fontsize=9,
+        )
+    doc.save(path)
+    doc.close()
+
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "txt": write_txt}
+
+
+def generate_corpus(output_dir, documents, words=3000, formats=("pdf", "docx", "txt"), seed=0):
+    """
+    Writes ``documents`` files to ``output_dir``, cycling through ``formats``.
+
+    Args:
+        output_dir (str): Directory for the documents; created if missing.
+        documents (int): Number of documents.
+        words (int): Approximate number of words per document.
+        formats (tuple): File formats to generate, from "pdf", "docx" and "txt".
+        seed (int): Seed of the text generator.
+
+    Returns:
+        list: The paths of the generated documents.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for number in range(documents):
+        file_format = formats[number % len(formats)]
+        path = os.path.join(output_dir, f"incident-report-{number:04d}.{file_format}")
+        WRITERS[file_format](path, synthetic_paragraphs(rng, words))
+        paths.append(path)
+    return paths
+
+
+def synthetic_queries(count, seed=0):
+    """Returns questions about the entities that appear in the corpus."""
+    rng = random.Random(seed)
+    templates = (
+        "What happened to {object}?",
+        "Who {verb} {object}?",
+        "Why was {object} {verb}?",
+        "What did {subject} do {detail}?",
+    )
+    return [
+        rng.choice(templates).format(
+            object=rng.choice(OBJECTS),
+            verb=rng.choice(VERBS),
+            subject=rng.choice(SUBJECTS).lower(),
+            detail=rng.choice(DETAILS),
+        )
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic document corpus generator.")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--documents", type=int, default=30)
+    parser.add_argument("--words", type=int, default=3000, help="Approximate words per document.")
+    parser.add_argument("--formats", nargs="+", default=list(WRITERS), choices=list(WRITERS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(
+        args.output_dir, args.documents, args.words, tuple(args.formats), args.seed
+    )
+    print(json.dumps({
+        "documents": len(paths),
+        "bytes": sum(os.path.getsize(path) for path in paths),
+        "paths": paths,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
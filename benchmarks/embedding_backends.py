@@ -0,0 +1,104 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Compares the PyTorch and ONNX Runtime embedding backends.
+
+Reports sentences per second for PyTorch, ONNX fp32 and ONNX int8, and the
+cosine similarity of each ONNX embedding to the PyTorch embedding of the same
+sentence. The model is exported to a temporary directory first.
+
+Usage (from the repository root):
+    python -m benchmarks.embedding_backends --sentences 2000 --threads 4
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from onnx_embedder import OnnxEmbedder, export_model
+
+
+def synthetic_sentences(count, seed=0):
+    """Sentences of 5 to 60 words, so batches mix short and long inputs."""
+    rng = random.Random(seed)
+    vocabulary = (
+        "the signal passed at danger network rail operates station platform train "
+        "driver maintenance inspection report track points failure delay incident "
+        "safety engineer timetable junction depot freight passenger line speed"
+    ).split()
+    return [
+        " ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 60))).capitalize() + "."
+        for _ in range(count)
+    ]
+
+
+def measure(encode, sentences, repeat):
+    encode(sentences[:32])  # Warm up
+    best = None
+    embeddings = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = np.asarray(encode(sentences), dtype="float32")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return embeddings, best
+
+
+def cosine_agreement(embeddings, reference):
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cosines = (embeddings * reference).sum(axis=1)
+    return {"mean": round(float(cosines.mean()), 5), "min": round(float(cosines.min()), 5)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark.")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=config.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=config.ONNX_INTRA_OP_THREADS,
+                        help="Intra-op threads for both backends (0: library default).")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    sentences = synthetic_sentences(args.sentences)
+
+    torch_model = SentenceTransformer(args.model, device="cpu")
+    reference, seconds = measure(
+        lambda batch: torch_model.encode(batch, batch_size=args.batch_size), sentences, args.repeat
+    )
+    results = [{
+        "backend": "torch",
+        "seconds": round(seconds, 3),
+        "sentences_per_second": round(len(sentences) / seconds, 1),
+    }]
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        export_model(args.model, model_dir, quantize=True)
+        for name, quantized in (("onnx", False), ("onnx-int8", True)):
+            embedder = OnnxEmbedder(
+                model_dir, quantized=quantized,
+                intra_op_threads=args.threads, batch_size=args.batch_size,
+            )
+            embeddings, seconds = measure(embedder.encode, sentences, args.repeat)
+            results.append({
+                "backend": name,
+                "seconds": round(seconds, 3),
+                "sentences_per_second": round(len(sentences) / seconds, 1),
+                "speedup": round(results[0]["seconds"] / seconds, 2),
+                "cosine_to_torch": cosine_agreement(embeddings, reference),
+            })
+
+    print(json.dumps({"model": args.model, "sentences": len(sentences), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Local stand-in for the Ollama generate API.
+
+Answers POST /api/generate with a canned knowledge-graph JSON response,
+emitted at a configurable token rate, in both streaming (NDJSON) and
+non-streaming modes. Point OLLAMA_URL at it to exercise the real client code
+without a GPU or a model download.
+
+Usage:
+    python benchmarks/fake_ollama.py --port 11434 --tokens-per-second 50
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = json.dumps(
+    {
+        "nodes": [
+            {"id": 1, "name": "Network Rail", "category": "Organisation"},
+            {"id": 2, "name": "Paddington Station", "category": "Location"},
+            {"id": 3, "name": "Signal SN45", "category": "Equipment"},
+            {"id": 4, "name": "Paddington Station", "category": "Station"},
+        ],
+        "links": [
+            {"source_id": 1, "target_id": 2, "relation": "Operates"},
+            {"source_id": 3, "target_id": 4, "relation": "Located at"},
+        ],
+    }
+)
+
+
+def tokenize(text):
+    """Splits text into word-and-punctuation pieces, roughly like LLM tokens."""
+    return re.findall(r"\s*[\w]+|\s*[^\w\s]", text)
+
+
+def make_handler(response_text, tokens_per_second, first_token_delay):
+    tokens = tokenize(response_text)
+    token_delay = 1 / tokens_per_second if tokens_per_second > 0 else 0
+
+    class FakeOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            model = payload.get("model", "llama3.2")
+            time.sleep(first_token_delay)
+
+            if not payload.get("stream", True):
+                time.sleep(token_delay * len(tokens))
+                body = json.dumps(
+                    {"model": model, "response": response_text, "done": True}
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                self._write_chunk({"model": model, "response": token, "done": False})
+                time.sleep(token_delay)
+            self._write_chunk({"model": model, "response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, message):
+            line = json.dumps(message).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+    return FakeOllamaHandler
+
+
+def start_fake_ollama(port=0, response_text=DEFAULT_RESPONSE, tokens_per_second=200.0,
+                      first_token_delay=0.05):
+    """
+    Starts the fake server on a background thread.
+
+    Returns:
+        tuple: The server (call ``shutdown()`` to stop it) and its base URL.
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port),
+        make_handler(response_text, tokens_per_second, first_token_delay),
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama generate API.")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port),
+        make_handler(DEFAULT_RESPONSE, args.tokens_per_second, args.first_token_delay),
+    )
+    print(f"Fake Ollama listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
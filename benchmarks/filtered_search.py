@@ -0,0 +1,85 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Measures filtered search latency against the size of the filtered subset.
+
+A ``ChunkIndex`` is built over synthetic embeddings and searched with random
+chunk-id subsets of increasing size. Every search must return the exact
+nearest neighbours within its subset.
+
+Usage (from the repository root):
+    python -m benchmarks.filtered_search --vectors 200000
+    python -m benchmarks.filtered_search --factory HNSW32 --subsets 100 10000 100000
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from benchmarks.vector_storage import synthetic_embeddings
+from indexing import ChunkIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered search latency benchmark.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=config.EMBEDDING_DIMENSION)
+    parser.add_argument("--factory", default="Flat")
+    parser.add_argument("--subsets", type=int, nargs="+", default=[10, 100, 1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--exact-max", type=int, default=config.INDEX_FILTER_EXACT_MAX)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = synthetic_embeddings(args.vectors + args.queries, args.dimension)
+    embeddings, queries = embeddings[:args.vectors], embeddings[args.vectors:]
+    chunk_ids = [str(i) for i in range(args.vectors)]
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        chunk_index = ChunkIndex(
+            index_dir, args.dimension, factory_string=args.factory,
+            exact_search_max=args.exact_max,
+        )
+        chunk_index.rebuild(chunk_ids, embeddings)
+
+        results = []
+        for subset_size in [None] + [s for s in args.subsets if s <= args.vectors]:
+            if subset_size is None:
+                subset, subset_ids = np.arange(args.vectors), None
+            else:
+                subset = np.sort(rng.choice(args.vectors, subset_size, replace=False))
+                subset_ids = [chunk_ids[i] for i in subset]
+            latencies = []
+            hits = 0
+            for query in queries:
+                start = time.perf_counter()
+                found = chunk_index.search(query.reshape(1, -1), args.k, subset_ids)
+                latencies.append((time.perf_counter() - start) * 1000)
+                distances = ((embeddings[subset] - query) ** 2).sum(axis=1)
+                expected = set(subset[np.argsort(distances)[:args.k]].tolist())
+                hits += len({int(chunk_id) for chunk_id, _ in found} & expected)
+            results.append({
+                "subset": subset_size or args.vectors,
+                "filtered": subset_size is not None,
+                "path": (
+                    "unfiltered" if subset_size is None
+                    else "exact" if subset_size <= args.exact_max else "selector"
+                ),
+                "recall": round(hits / (args.k * len(queries)), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            })
+
+    print(json.dumps({
+        "vectors": args.vectors,
+        "factory_string": args.factory,
+        "k": args.k,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
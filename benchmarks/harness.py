@@ -0,0 +1,358 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+End-to-end benchmark of ingestion, queries and streaming.
+
+Runs app.py under uvicorn against local stand-ins: the fake Ollama server,
+mongomock (or a scratch database on a local mongod), and the local storage
+backend in place of HDFS. A synthetic PDF/DOCX/TXT corpus is uploaded
+through POST /document and the server is then queried over HTTP.
+
+Reports:
+    ingestion: documents and chunks per second, from the first upload to
+        the last job finishing, and the mean time of each ingestion stage
+    query: /process_documents/ latency (retrieval and generation)
+    retrieval: /process_documents/batch latency without generation
+    streaming: time to the first event of /stream_graph/ and to the first
+        byte of /stream_text_output/
+
+Results are written as JSON with the git commit they were measured at;
+--compare prints the change of the headline metrics against an earlier run.
+
+Usage (from the repository root):
+    python -m benchmarks.harness --output bench.json
+    python -m benchmarks.harness --documents 60 --queries 200 --compare bench.json
+    python -m benchmarks.harness --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+import config
+from benchmarks.corpus import WRITERS, generate_corpus, synthetic_queries
+from benchmarks.fake_ollama import start_fake_ollama
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain",
+}
+
+# Metrics compared by --compare, and whether a higher value is better
+HEADLINE_METRICS = {
+    "ingestion.docs_per_second": True,
+    "ingestion.chunks_per_second": True,
+    "query.p50_ms": False,
+    "query.p95_ms": False,
+    "query.p99_ms": False,
+    "retrieval.p50_ms": False,
+    "retrieval.p99_ms": False,
+    "streaming.graph_first_event.p50_ms": False,
+    "streaming.text_first_byte.p50_ms": False,
+}
+
+
+def summarize(latencies_ms):
+    latencies_ms = np.asarray(latencies_ms)
+    return {
+        "count": int(latencies_ms.size),
+        "mean_ms": round(float(latencies_ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    """Returns the commit being measured and whether the tree has local changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def start_server(scratch, port, env):
+    """Starts app.py under uvicorn in a scratch working directory."""
+    log = open(os.path.join(scratch, "server.log"), "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app:app", "--app-dir", ROOT,
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=scratch, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, log
+
+
+def wait_until_ready(client, process, log_path, timeout=600):
+    started = time.perf_counter()
+    while True:
+        if process.poll() is not None:
+            with open(log_path, "r", encoding="utf-8") as f:
+                raise RuntimeError(f"Server exited during start-up:\n{f.read()[-2000:]}")
+        try:
+            if client.get("/readyz").status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError("Server did not become ready in time.")
+        time.sleep(0.1)
+
+
+def measure_ingestion(client, paths, poll_interval=0.1, timeout=1800):
+    """Uploads every document, waits for its job and derives throughput from job times."""
+    upload_latencies = []
+    job_ids = []
+    for path in paths:
+        file_format = path.rsplit(".", 1)[-1]
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            response = client.post(
+                "/document",
+                files={"file": (os.path.basename(path), f, CONTENT_TYPES[file_format])},
+            )
+            upload_latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        if response.json()["status"] == "queued":
+            job_ids.append(response.json()["job_id"])
+
+    jobs = {}
+    pending = list(job_ids)
+    started = time.perf_counter()
+    while pending:
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError(f"{len(pending)} ingestion jobs did not finish in time.")
+        time.sleep(poll_interval)
+        for job_id in list(pending):
+            job = client.get(f"/jobs/{job_id}").json()
+            if job["status"] in ("succeeded", "failed"):
+                jobs[job_id] = job
+                pending.remove(job_id)
+
+    succeeded = [job for job in jobs.values() if job["status"] == "succeeded"]
+    if jobs:
+        # Job timestamps come from the server clock, so polling does not add to the total
+        created = min(datetime.fromisoformat(job["created_at"]) for job in jobs.values())
+        finished = max(datetime.fromisoformat(job["finished_at"]) for job in jobs.values())
+        seconds = max((finished - created).total_seconds(), 1e-3)
+    else:
+        # Every upload was a duplicate of content already ingested
+        seconds = 0.0
+    chunks = sum(job["result"]["chunk_count"] for job in succeeded)
+
+    stage_seconds = {}
+    for job in succeeded:
+        for name, stage in job.get("stages", {}).items():
+            stage_seconds.setdefault(name, []).append(stage["seconds"])
+    return {
+        "documents": len(paths),
+        "succeeded": len(succeeded),
+        "failed": len(jobs) - len(succeeded),
+        "deduplicated": len(paths) - len(job_ids),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "docs_per_second": round(len(succeeded) / seconds, 2) if jobs else 0.0,
+        "chunks_per_second": round(chunks / seconds, 1) if jobs else 0.0,
+        "upload": summarize(upload_latencies),
+        "stage_mean_seconds": {
+            name: round(float(np.mean(values)), 4) for name, values in stage_seconds.items()
+        },
+        "errors": sorted({job.get("error") for job in jobs.values() if job["status"] == "failed"}),
+    }
+
+
+def measure_requests(client, path, bodies):
+    latencies = []
+    for body in bodies:
+        start = time.perf_counter()
+        response = client.post(path, json=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return summarize(latencies)
+
+
+def measure_first_byte(client, path, bodies, first_line=False):
+    """Measures the time to the first byte, or first complete line, of a streamed response."""
+    first = []
+    total = []
+    for body in bodies:
+        start = time.perf_counter()
+        with client.stream("POST", path, json=body) as response:
+            response.raise_for_status()
+            chunks = response.iter_lines() if first_line else response.iter_bytes()
+            first_seen = None
+            for _ in chunks:
+                if first_seen is None:
+                    first_seen = time.perf_counter()
+        first.append(((first_seen or time.perf_counter()) - start) * 1000)
+        total.append((time.perf_counter() - start) * 1000)
+    return {"first": summarize(first), "total": summarize(total)}
+
+
+def lookup(results, metric):
+    for key in metric.split("."):
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(previous, current):
+    """Returns the change of each headline metric between two runs."""
+    comparison = {}
+    for metric, higher_is_better in HEADLINE_METRICS.items():
+        before, after = lookup(previous, metric), lookup(current, metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else None
+        comparison[metric] = {
+            "before": before,
+            "after": after,
+            "change_percent": round(change, 1) if change is not None else None,
+            "better": None if change is None else (change > 0) == higher_is_better,
+        }
+    return {"previous_commit": previous.get("commit"), "metrics": comparison}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ingestion and query benchmark.")
+    parser.add_argument("--documents", type=int, default=30)
+    parser.add_argument("--words", type=int, default=3000, help="Approximate words per document.")
+    parser.add_argument("--formats", nargs="+", default=list(WRITERS), choices=list(WRITERS))
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--streams", type=int, default=10, help="Streaming requests per endpoint.")
+    parser.add_argument("--top-k", type=int, default=10, help="top_k of the retrieval requests.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0,
+                        help="Token rate of the fake Ollama server.")
+    parser.add_argument("--first-token-delay", type=float, default=0.05,
+                        help="Seconds the fake Ollama server waits before its first token.")
+    parser.add_argument("--mongo-uri", default="mongomock://",
+                        help="mongomock:// or a local mongod; a scratch database is dropped afterwards.")
+    parser.add_argument("--ingest-workers", type=int, default=config.INGEST_WORKERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File to write the JSON results to.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    commit, dirty = git_revision()
+    database = f"benchmark_{uuid.uuid4().hex[:12]}"
+    ollama, ollama_url = start_fake_ollama(
+        port=0,
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+    )
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            **vars(args),
+            "embedding_model": config.EMBEDDING_MODEL,
+            "embedding_backend": config.EMBEDDING_BACKEND,
+            "index_factory": config.INDEX_FACTORY,
+            "chunking_mode": config.CHUNKING_MODE,
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as scratch:
+        paths = generate_corpus(
+            os.path.join(scratch, "corpus"), args.documents, args.words,
+            tuple(args.formats), args.seed,
+        )
+        results["corpus_bytes"] = sum(os.path.getsize(path) for path in paths)
+        env = dict(
+            os.environ,
+            MONGO_URI=args.mongo_uri,
+            MONGO_DATABASE=database,
+            STORAGE_BACKEND="local",
+            LOCAL_STORAGE_DIR=os.path.join(scratch, "storage"),
+            INDEX_DIR=os.path.join(scratch, "index"),
+            EMBEDDING_CACHE_DIR=os.path.join(scratch, "cache"),
+            INGEST_SPOOL_DIR=os.path.join(scratch, "uploads"),
+            INGEST_WORKERS=str(args.ingest_workers),
+            INGEST_POLL_INTERVAL_SECONDS="0.05",
+            # Exports are reused between runs rather than made in the scratch directory
+            ONNX_MODEL_DIR=os.path.abspath(config.ONNX_MODEL_DIR),
+            RESPONSE_CACHE_ENABLED="false",
+            OLLAMA_URL=ollama_url,
+        )
+        port = free_port()
+        server, server_log = start_server(scratch, port, env)
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+                results["ready_seconds"] = round(
+                    wait_until_ready(client, server, server_log.name), 3
+                )
+                results["ingestion"] = measure_ingestion(client, paths)
+
+                queries = synthetic_queries(args.queries, args.seed)
+                results["query"] = measure_requests(
+                    client, "/process_documents/", [{"user_query": q} for q in queries]
+                )
+                results["retrieval"] = measure_requests(
+                    client, "/process_documents/batch",
+                    [{"user_queries": [q], "top_k": args.top_k} for q in queries],
+                )
+
+                stream_bodies = [{"user_query": q} for q in synthetic_queries(args.streams, args.seed + 1)]
+                graph = measure_first_byte(client, "/stream_graph/", stream_bodies, first_line=True)
+                text = measure_first_byte(client, "/stream_text_output/", stream_bodies)
+                results["streaming"] = {
+                    "graph_first_event": graph["first"],
+                    "graph_total": graph["total"],
+                    "text_first_byte": text["first"],
+                    "text_total": text["total"],
+                }
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            server_log.close()
+            ollama.shutdown()
+            if not args.mongo_uri.startswith("mongomock://"):
+                from pymongo import MongoClient
+
+                MongoClient(args.mongo_uri).drop_database(database)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            results["comparison"] = compare(json.load(f), results)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
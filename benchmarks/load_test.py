@@ -0,0 +1,84 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Checks that slow /process_documents/ calls do not stall other endpoints.
+
+Measures /files/ listing latency on an idle server, then again while a number
+of long /process_documents/ requests are in flight, and prints both.
+
+Usage:
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000 --in-flight 8
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+
+
+def timed_get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        response.read()
+    return (time.perf_counter() - start) * 1000
+
+
+def post_query(url, query):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({"user_query": query}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+    except Exception as e:
+        print(f"Query failed: {e}")
+
+
+def measure_listing(base_url, samples):
+    latencies = [timed_get(f"{base_url}/files/") for _ in range(samples)]
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max_ms": latencies[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--in-flight", type=int, default=8)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--query", default="Who was involved in the incident?")
+    args = parser.parse_args()
+
+    idle = measure_listing(args.base_url, args.samples)
+
+    queries = [
+        threading.Thread(
+            target=post_query,
+            args=(f"{args.base_url}/process_documents/", args.query),
+            daemon=True,
+        )
+        for _ in range(args.in_flight)
+    ]
+    for thread in queries:
+        thread.start()
+    time.sleep(0.5)  # Let the queries reach the LLM stage
+    loaded = measure_listing(args.base_url, args.samples)
+    still_running = sum(thread.is_alive() for thread in queries)
+
+    print(json.dumps(
+        {
+            "idle": idle,
+            "with_queries_in_flight": loaded,
+            "queries_still_running_after_listing": still_running,
+        },
+        indent=2,
+    ))
+
+
+if __name__ == "__main__":
+    main()
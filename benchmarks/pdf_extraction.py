@@ -0,0 +1,87 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Measures process_pdf throughput in pages per second at several worker counts.
+
+Without --pdf a synthetic PDF of --pages text-heavy pages is generated in a
+temporary directory. Every run must produce the same text as the
+single-process run.
+
+Usage (from the repository root):
+    python -m benchmarks.pdf_extraction --pages 400 --workers 1 2 4 8
+    python -m benchmarks.pdf_extraction --pdf documents/report.pdf --no-tables
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import fitz
+
+from process_document import process_pdf
+
+
+def synthetic_pdf(path, pages, seed=0):
+    """Writes a PDF whose pages are filled with paragraphs of random words."""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n".join(
+            " ".join(rng.choice(vocabulary) for _ in range(12)) for _ in range(60)
+        )
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def measure(path, workers, repeat, detect_tables):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = process_pdf(path, workers=workers, detect_tables=detect_tables)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extraction throughput benchmark.")
+    parser.add_argument("--pdf", help="PDF to extract (default: a generated one).")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per worker count; the best is kept.")
+    parser.add_argument("--no-tables", action="store_true", help="Skip table detection.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(scratch, "benchmark.pdf")
+            synthetic_pdf(path, args.pages)
+        with fitz.open(path) as doc:
+            page_count = doc.page_count
+
+        baseline_text = None
+        results = []
+        for workers in args.workers:
+            # Warm up so pool start-up is not counted
+            process_pdf(path, workers=workers, detect_tables=not args.no_tables)
+            extracted, seconds = measure(path, workers, args.repeat, not args.no_tables)
+            if baseline_text is None:
+                baseline_text = extracted["text"]
+            results.append({
+                "workers": workers,
+                "seconds": round(seconds, 3),
+                "pages_per_second": round(page_count / seconds, 1),
+                "same_text": extracted["text"] == baseline_text,
+            })
+
+    print(json.dumps({"pages": page_count, "cpus": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
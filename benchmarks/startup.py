@@ -0,0 +1,104 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Measures service start-up: the time to import app.py, the time until
+/readyz reports ready, and the latency of the first and second queries.
+
+Each scenario runs in a fresh Python process, so module imports and model
+loads are really cold. MongoDB is replaced by mongomock, storage by a
+temporary directory and Ollama by the fake server, so no external services
+are needed; the embedding model must be available locally or downloadable.
+
+Usage (from the repository root):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --scenarios lazy
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    # Models load during startup, before /readyz reports ready
+    "warmup": {"MODEL_WARMUP": "true"},
+    # Models load on the first query
+    "lazy": {"MODEL_WARMUP": "false"},
+}
+
+
+def run_child():
+    """Starts the app in this process and prints its timings as JSON."""
+    started = time.perf_counter()
+    import app
+
+    import_seconds = time.perf_counter() - started
+
+    from fastapi.testclient import TestClient
+
+    timings = {"import_seconds": round(import_seconds, 3)}
+    started = time.perf_counter()
+    with TestClient(app.app) as client:
+        while client.get("/readyz").status_code != 200:
+            if time.perf_counter() - started > 600:
+                raise RuntimeError(f"Service not ready: {client.get('/readyz').json()}")
+            time.sleep(0.05)
+        timings["ready_seconds"] = round(time.perf_counter() - started, 3)
+
+        for name, query in (("first_query_ms", "Who operates Paddington?"),
+                            ("second_query_ms", "Where is signal SN45?")):
+            request_started = time.perf_counter()
+            response = client.post("/process_documents/", json={"user_query": query})
+            response.raise_for_status()
+            timings[name] = round((time.perf_counter() - request_started) * 1000, 1)
+    print(json.dumps(timings))
+
+
+def run_scenario(name, settings, ollama_url):
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(
+            os.environ,
+            MONGO_URI="mongomock://",
+            STORAGE_BACKEND="local",
+            LOCAL_STORAGE_DIR=os.path.join(scratch, "storage"),
+            INDEX_DIR=os.path.join(scratch, "index"),
+            EMBEDDING_CACHE_DIR=os.path.join(scratch, "cache"),
+            INGEST_SPOOL_DIR=os.path.join(scratch, "uploads"),
+            RESPONSE_CACHE_ENABLED="false",
+            OLLAMA_URL=ollama_url,
+            **settings,
+        )
+        child = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child"],
+            env=env, capture_output=True, text=True,
+        )
+    if child.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{child.stderr[-2000:]}")
+    return {"scenario": name, **json.loads(child.stdout.strip().splitlines()[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start-up latency benchmark.")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    from benchmarks.fake_ollama import start_fake_ollama
+
+    server, ollama_url = start_fake_ollama(
+        port=0, tokens_per_second=100000, first_token_delay=0
+    )
+    try:
+        results = [run_scenario(name, SCENARIOS[name], ollama_url) for name in args.scenarios]
+    finally:
+        server.shutdown()
+    print(json.dumps({"results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
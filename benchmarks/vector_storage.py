@@ -0,0 +1,102 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Compares compressed vector storage with the flat float32 index.
+
+Each configuration is built as a ``ChunkIndex`` over the same synthetic
+embeddings and reports recall@k against exact float32 search, per-query
+latency and the memory report: bytes per vector, index size, the size of
+the rescoring sidecar on disk and the process RSS.
+
+Usage (from the repository root):
+    python -m benchmarks.vector_storage --vectors 200000
+    python -m benchmarks.vector_storage --factories Flat SQ8 --rescore-factor 8
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+import config
+from indexing import ChunkIndex
+
+
+def synthetic_embeddings(count, dimension, clusters=256, seed=0):
+    """Unit vectors scattered around random centres, like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, count)]
+    vectors += 0.6 * rng.standard_normal((count, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure(chunk_index, queries, expected, k):
+    latencies = []
+    hits = 0
+    for query, truth in zip(queries, expected):
+        start = time.perf_counter()
+        found = chunk_index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len({int(chunk_id) for chunk_id, _ in found} & set(truth.tolist()))
+    return {
+        "recall": round(hits / (k * len(queries)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed vector storage benchmark.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=config.EMBEDDING_DIMENSION)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factories", nargs="+", default=["Flat", "SQfp16", "SQ8"])
+    parser.add_argument("--rescore-factor", type=int, default=config.INDEX_RESCORE_FACTOR)
+    args = parser.parse_args()
+
+    embeddings = synthetic_embeddings(args.vectors + args.queries, args.dimension)
+    embeddings, queries = embeddings[:args.vectors], embeddings[args.vectors:]
+    chunk_ids = [str(i) for i in range(args.vectors)]
+
+    exact = faiss.IndexFlatL2(args.dimension)
+    exact.add(embeddings)
+    _, expected = exact.search(queries, args.k)
+    del exact
+
+    results = []
+    for factory_string in args.factories:
+        # Rescoring a float32 index cannot change its ranking
+        for rescore in ((False,) if factory_string == "Flat" else (False, True)):
+            with tempfile.TemporaryDirectory() as index_dir:
+                chunk_index = ChunkIndex(
+                    index_dir, args.dimension, factory_string=factory_string,
+                    rescore=rescore, rescore_factor=args.rescore_factor,
+                )
+                chunk_index.rebuild(chunk_ids, embeddings)
+                report = chunk_index.memory_report()
+                results.append({
+                    "factory_string": factory_string,
+                    "rescore": rescore,
+                    **measure(chunk_index, queries, expected, args.k),
+                    "bytes_per_vector": report["bytes_per_vector"],
+                    "compression": report["compression"],
+                    "index_bytes": report["index_bytes"],
+                    "rescore_sidecar_bytes": report["rescore_sidecar_bytes"],
+                    "process_rss_bytes": report["process_rss_bytes"],
+                })
+                del chunk_index
+
+    print(json.dumps({
+        "vectors": args.vectors,
+        "dimension": args.dimension,
+        "k": args.k,
+        "rescore_factor": args.rescore_factor,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import logging
+
+import numpy as np
+
+
+def count_tokens(tokenizer, texts):
+    """Counts the tokens of each text with a single batched tokenizer call."""
+    if not texts:
+        return []
+    encoded = tokenizer(texts, add_special_tokens=False)["input_ids"]
+    return [len(ids) for ids in encoded]
+
+
+def truncate_to_tokens(tokenizer, text, max_tokens):
+    """Cuts text after its first ``max_tokens`` tokens, on a token boundary."""
+    encoded = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        truncation=True,
+        max_length=max_tokens,
+    )
+    offsets = encoded["offset_mapping"]
+    return text[: offsets[-1][1]] if offsets else ""
+
+
+def pack_context(chunks, embeddings, tokenizer, token_budget,
+                 redundancy_threshold=0.92, mmr_lambda=0.7, min_chunk_tokens=32):
+    """
+    Selects the retrieved chunks that go into the prompt.
+
+    Chunks are picked in maximal marginal relevance order, trading retrieval
+    relevance against similarity to chunks already picked. Chunks that are
+    near-duplicates of a picked chunk are dropped. Picking stops once the
+    token budget is spent; the chunk that overflows the budget is truncated
+    if enough room remains for it to be useful.
+
+    Args:
+        chunks (list): Chunk dicts with a ``chunk`` text and, optionally, a
+            retrieval ``distance`` (lower is more relevant).
+        embeddings (np.ndarray): One embedding per chunk.
+        tokenizer: A Hugging Face tokenizer used to count tokens.
+        token_budget (int): Maximum number of context tokens.
+        redundancy_threshold (float): Cosine similarity at which a chunk
+            counts as a duplicate of one already picked.
+        mmr_lambda (float): Weight of relevance versus novelty (0 to 1).
+        min_chunk_tokens (int): Smallest truncated chunk worth including.
+
+    Returns:
+        tuple: The packed chunks ordered by relevance, and packing statistics.
+    """
+    token_counts = count_tokens(tokenizer, [chunk["chunk"] for chunk in chunks])
+    stats = {
+        "chunks_retrieved": len(chunks),
+        "chunks_packed": 0,
+        "duplicates_removed": 0,
+        "context_tokens_retrieved": sum(token_counts),
+        "context_tokens_packed": 0,
+    }
+    if not chunks:
+        return [], stats
+
+    distances = np.array(
+        [chunk.get("distance", rank) for rank, chunk in enumerate(chunks)], dtype="float32"
+    )
+    spread = distances.max() - distances.min()
+    relevance = 1 - (distances - distances.min()) / spread if spread else np.ones(len(chunks))
+
+    embeddings = np.asarray(embeddings, dtype="float32")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1, norms)
+    similarity = normalized @ normalized.T
+
+    selected = []
+    texts = {}
+    remaining_budget = token_budget
+    candidates = list(range(len(chunks)))
+    while candidates and remaining_budget > 0:
+        if selected:
+            redundancy = similarity[np.ix_(candidates, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates))
+        scores = mmr_lambda * relevance[candidates] - (1 - mmr_lambda) * redundancy
+        position = int(np.argmax(scores))
+        best = candidates.pop(position)
+
+        if redundancy[position] >= redundancy_threshold:
+            stats["duplicates_removed"] += 1
+            continue
+        if token_counts[best] <= remaining_budget:
+            texts[best] = chunks[best]["chunk"]
+            remaining_budget -= token_counts[best]
+        elif remaining_budget >= min_chunk_tokens:
+            texts[best] = truncate_to_tokens(tokenizer, chunks[best]["chunk"], remaining_budget)
+            remaining_budget = 0
+        else:
+            continue
+        selected.append(best)
+
+    packed = [
+        {**chunks[i], "chunk": texts[i]}
+        for i in sorted(selected, key=lambda i: distances[i])
+    ]
+    stats["chunks_packed"] = len(packed)
+    stats["context_tokens_packed"] = token_budget - remaining_budget
+    logging.debug(f"Packed context: {stats}")
+    return packed, stats
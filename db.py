@@ -0,0 +1,40 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Shared MongoDB client.
+
+One client is created per process, on first use, and it does not connect
+until the first operation, so importing modules that hold collection handles
+costs no network round trips. A ``mongomock://`` MONGO_URI selects an
+in-memory mongomock client for tests and benchmarks.
+"""
+import threading
+
+import config
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if config.MONGO_URI.startswith("mongomock://"):
+                    import mongomock
+
+                    _client = mongomock.MongoClient()
+                else:
+                    from pymongo import MongoClient
+
+                    _client = MongoClient(config.MONGO_URI, connect=False)
+    return _client
+
+
+def get_database():
+    return get_client()[config.MONGO_DATABASE]
+
+
+def ping():
+    """Raises if MongoDB cannot be reached."""
+    get_client().admin.command("ping")
@@ -0,0 +1,199 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCacheLocked(RuntimeError):
+    """Raised when another process already has the cache directory open."""
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk cache of embeddings.
+
+    Vectors live in a memory-mapped float32 matrix with one row per entry and a
+    JSON index maps each key (a hash of model name and text) to its row. When
+    the cache is full the least recently used entry gives up its row.
+
+    Row assignments are appended to a log rather than rewriting the JSON index
+    on every put. Once the log holds ``compact_ratio`` times as many lines as
+    the cache has entries, it is folded into a new JSON snapshot. The log is
+    rotated under the lock and the snapshot is written outside it.
+
+    Free rows are handed out from memory, so only one process may use a cache
+    directory at a time; it holds an exclusive lock on ``embeddings.lock``.
+    """
+
+    def __init__(self, cache_dir, dimension, max_entries, compact_ratio=2):
+        self.matrix_path = os.path.join(cache_dir, "embeddings.f32")
+        self.index_path = os.path.join(cache_dir, "embeddings.index.json")
+        self.log_path = os.path.join(cache_dir, "embeddings.index.log")
+        self.compact_ratio = compact_ratio
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._log_lines = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(cache_dir, "embeddings.lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise EmbeddingCacheLocked(f"Embedding cache {cache_dir} is in use by another process.")
+        self.rows = OrderedDict()  # key -> row, least recently used first
+        loaded = self._load()
+        if not loaded:
+            self.matrix = np.memmap(
+                self.matrix_path, dtype="float32", mode="w+",
+                shape=(max_entries, dimension),
+            )
+            for path in (f"{self.log_path}.old", self.log_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        # Reversed so that pop() hands out the lowest free row first
+        self.free_rows = sorted(
+            set(range(max_entries)) - set(self.rows.values()), reverse=True
+        )
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        if not loaded:
+            self.flush()  # The log is only read on top of a snapshot
+
+    @staticmethod
+    def key(model_name, text):
+        """Returns the cache key of a text embedded by the given model."""
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.index_path)):
+            return False
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["dimension"] != self.dimension or saved["max_entries"] != self.max_entries:
+            logging.warning("Embedding cache settings changed, discarding the cache.")
+            return False
+        self.matrix = np.memmap(
+            self.matrix_path, dtype="float32", mode="r+",
+            shape=(self.max_entries, self.dimension),
+        )
+        self.rows = OrderedDict(saved["rows"])
+        # A log left by an interrupted compaction precedes the current one
+        for path in (f"{self.log_path}.old", self.log_path):
+            self._replay(path)
+        logging.info(f"Loaded embedding cache with {len(self.rows)} entries.")
+        return True
+
+    def _replay(self, path):
+        """Applies the row assignments of a log to ``rows``."""
+        if not os.path.exists(path):
+            return
+        row_keys = {row: key for key, row in self.rows.items()}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 2:
+                    continue  # Torn last line
+                key, row = parts[0], int(parts[1])
+                previous = row_keys.get(row)
+                if previous is not None and previous != key:
+                    del self.rows[previous]
+                self.rows.pop(key, None)
+                self.rows[key] = row
+                row_keys[row] = key
+                self._log_lines += 1
+
+    def get_many(self, keys):
+        """
+        Looks up a list of keys.
+
+        Returns:
+            tuple: A ``(len(keys), dimension)`` float32 array with cached rows
+            filled in, and the positions of the keys that were not cached.
+        """
+        embeddings = np.zeros((len(keys), self.dimension), dtype="float32")
+        missing = []
+        with self._lock:
+            for position, key in enumerate(keys):
+                row = self.rows.get(key)
+                if row is None:
+                    missing.append(position)
+                    continue
+                self.rows.move_to_end(key)
+                embeddings[position] = self.matrix[row]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return embeddings, missing
+
+    def put_many(self, keys, embeddings):
+        """Stores embeddings under their keys, evicting old entries when full."""
+        assigned = []
+        with self._lock:
+            for key, embedding in zip(keys, embeddings):
+                row = self.rows.get(key)
+                if row is None:
+                    if self.free_rows:
+                        row = self.free_rows.pop()
+                    else:
+                        _, row = self.rows.popitem(last=False)
+                        self.evictions += 1
+                    self.rows[key] = row
+                    assigned.append(f"{key} {row}\n")
+                else:
+                    self.rows.move_to_end(key)
+                self.matrix[row] = embedding
+            if assigned:
+                self._log.write("".join(assigned))
+                self._log.flush()
+                self._log_lines += len(assigned)
+            compact = self._log_lines > self.compact_ratio * max(len(self.rows), 1)
+        if compact:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the matrix and a JSON snapshot of the rows, and starts a new log.
+        Called when the log grows too long and at shutdown.
+        """
+        with self._compact_lock:
+            with self._lock:
+                self.matrix.flush()
+                rows = list(self.rows.items())
+                self._log.close()
+                os.replace(self.log_path, f"{self.log_path}.old")
+                self._log = open(self.log_path, "a", encoding="utf-8")
+                self._log_lines = 0
+            with open(f"{self.index_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "dimension": self.dimension,
+                        "max_entries": self.max_entries,
+                        "rows": rows,
+                    },
+                    f,
+                )
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+            os.remove(f"{self.log_path}.old")
+
+    def stats(self):
+        """Returns the hit, miss and eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.rows),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
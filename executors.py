@@ -0,0 +1,39 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Sized thread pools that keep blocking work off the asyncio event loop.
+
+CPU-bound stages (embedding, FAISS search, document parsing) run on the CPU
+pool. PyTorch, FAISS and PyMuPDF release the GIL while they work, so threads
+use every core without pickling models into worker processes. Blocking I/O
+(MongoDB, HDFS, HTTP) runs on the larger I/O pool so slow calls cannot starve
+CPU work or each other.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+cpu_executor = ThreadPoolExecutor(
+    max_workers=config.CPU_POOL_SIZE, thread_name_prefix="cpu"
+)
+io_executor = ThreadPoolExecutor(
+    max_workers=config.IO_POOL_SIZE, thread_name_prefix="io"
+)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Runs a CPU-bound callable on the CPU pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    """Runs a blocking I/O callable on the I/O pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+    io_executor.shutdown(wait=False, cancel_futures=True)
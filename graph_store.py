@@ -0,0 +1,156 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import hashlib
+import logging
+import re
+import unicodedata
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+
+def normalize_name(name):
+    """Normalizes an entity name so spelling variants merge into one node."""
+    name = unicodedata.normalize("NFKC", str(name)).casefold()
+    name = re.sub(r"\s+", " ", name)
+    return name.strip(" \"'`.,;:")
+
+
+def link_key(source_key, relation, target_key):
+    raw = f"{source_key}\x1f{normalize_name(relation)}\x1f{target_key}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class GraphStore:
+    """
+    Persistent knowledge graph in MongoDB.
+
+    Nodes are keyed by their normalized name, so an entity extracted again
+    by a later query is merged into the existing document by an upsert
+    instead of being re-merged in memory. Every node and link records the
+    chunk ids it was extracted from, which is what ``subgraph`` serves.
+    """
+
+    def __init__(self, db):
+        self.nodes_collection = db["graph_nodes"]
+        self.links_collection = db["graph_links"]
+
+    def ensure_indexes(self):
+        self.nodes_collection.create_index("chunk_ids")
+        self.links_collection.create_index("chunk_ids")
+        self.links_collection.create_index("source")
+        self.links_collection.create_index("target")
+
+    def save_graph(self, nodes, links, chunk_ids):
+        """
+        Upserts merged nodes and links extracted from the given chunks.
+
+        Args:
+            nodes (list): Nodes as returned by ``merge_duplicates``.
+            links (list): Links referencing those node ids.
+            chunk_ids (list): Ids of the chunks the graph was extracted from.
+        """
+        chunk_ids = [str(chunk_id) for chunk_id in chunk_ids]
+        now = datetime.utcnow()
+        node_keys = {}
+        node_ops = {}
+        for node in nodes:
+            key = normalize_name(node["name"])
+            if not key:
+                continue
+            node_keys[node["id"]] = key
+            categories = [c.strip() for c in str(node.get("category", "")).split(",") if c.strip()]
+            node_ops[key] = UpdateOne(
+                {"_id": key},
+                {
+                    "$setOnInsert": {"name": node["name"], "created_at": now},
+                    "$set": {"updated_at": now},
+                    "$addToSet": {
+                        "categories": {"$each": categories},
+                        "chunk_ids": {"$each": chunk_ids},
+                    },
+                },
+                upsert=True,
+            )
+
+        link_ops = {}
+        for link in links:
+            source_key = node_keys.get(link["source_id"])
+            target_key = node_keys.get(link["target_id"])
+            if source_key is None or target_key is None:
+                continue
+            key = link_key(source_key, link["relation"], target_key)
+            link_ops[key] = UpdateOne(
+                {"_id": key},
+                {
+                    "$setOnInsert": {
+                        "source": source_key,
+                        "target": target_key,
+                        "relation": link["relation"],
+                        "created_at": now,
+                    },
+                    "$set": {"updated_at": now},
+                    "$addToSet": {"chunk_ids": {"$each": chunk_ids}},
+                },
+                upsert=True,
+            )
+
+        if node_ops:
+            self.nodes_collection.bulk_write(list(node_ops.values()), ordered=False)
+        if link_ops:
+            self.links_collection.bulk_write(list(link_ops.values()), ordered=False)
+        logging.debug(f"Saved {len(node_ops)} nodes and {len(link_ops)} links to the graph store.")
+
+    def subgraph(self, chunk_ids, limit=None):
+        """
+        Returns the stored graph extracted from any of the given chunks, in the
+        same node/link format the LLM produces.
+        """
+        chunk_ids = [str(chunk_id) for chunk_id in chunk_ids]
+        cursor = self.nodes_collection.find(
+            {"chunk_ids": {"$in": chunk_ids}}, {"name": 1, "categories": 1}
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+
+        nodes = []
+        numeric_ids = {}
+        for position, doc in enumerate(cursor, start=1):
+            numeric_ids[doc["_id"]] = position
+            nodes.append({
+                "id": position,
+                "name": doc["name"],
+                "category": ", ".join(doc.get("categories", [])),
+            })
+
+        links = [
+            {
+                "source_id": numeric_ids[doc["source"]],
+                "target_id": numeric_ids[doc["target"]],
+                "relation": doc["relation"],
+            }
+            for doc in self.links_collection.find(
+                {"chunk_ids": {"$in": chunk_ids}},
+                {"source": 1, "target": 1, "relation": 1},
+            )
+            if doc["source"] in numeric_ids and doc["target"] in numeric_ids
+        ]
+        return {"nodes": nodes, "links": links}
+
+    def remove_chunks(self, chunk_ids):
+        """Forgets deleted chunks and drops graph elements no chunk supports any more."""
+        chunk_ids = [str(chunk_id) for chunk_id in chunk_ids]
+        if not chunk_ids:
+            return
+        for collection in (self.nodes_collection, self.links_collection):
+            # Only elements that cited these chunks can have lost their last one
+            touched = [
+                doc["_id"] for doc in collection.find({"chunk_ids": {"$in": chunk_ids}}, {"_id": 1})
+            ]
+            if not touched:
+                continue
+            collection.update_many(
+                {"_id": {"$in": touched}},
+                {"$pull": {"chunk_ids": {"$in": chunk_ids}}},
+            )
+            collection.delete_many({"_id": {"$in": touched}, "chunk_ids": {"$size": 0}})
@@ -0,0 +1,208 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import json
+import logging
+
+from graph_store import normalize_name
+
+# Arrays whose member objects are emitted as soon as they close
+GRAPH_ARRAYS = {"nodes": "node", "links": "link"}
+
+
+class GraphStreamParser:
+    """
+    Incremental JSON scanner over LLM token fragments.
+
+    Tokens are fed in as they arrive. Every object that is a direct member of
+    a ``nodes`` or ``links`` array is returned as soon as its closing brace
+    has been seen, without waiting for the rest of the response. Text before
+    the first ``{`` (such as Markdown fences) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0  # Next buffer index to scan
+        self.stack = []  # One [container, key] per open object or array
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None
+        self.capture_start = None  # Buffer index of the object being captured
+        self.capture_kind = None
+        self.finished = False
+
+    def feed(self, text):
+        """
+        Consumes a fragment of the response.
+
+        Returns:
+            list: ``(kind, object)`` tuples, where kind is ``node`` or ``link``,
+            for each graph object completed by this fragment.
+        """
+        completed = []
+        self.buffer += text
+        while self.position < len(self.buffer) and not self.finished:
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = self.buffer[self.string_start:self.position]
+            elif not self.stack and char != "{":
+                pass  # Outside the JSON object
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.position + 1
+            elif char == ":" and self.stack:
+                self.stack[-1][1] = self.last_string  # Key of the upcoming value
+            elif char == ",":
+                if self.stack and self.stack[-1][0] == "{":
+                    self.stack[-1][1] = None
+            elif char in "{[":
+                parent = self.stack[-1] if self.stack else None
+                if (
+                    char == "{"
+                    and self.capture_start is None
+                    and parent is not None
+                    and parent[0] == "["
+                    and parent[1] in GRAPH_ARRAYS
+                ):
+                    self.capture_start = self.position
+                    self.capture_kind = GRAPH_ARRAYS[parent[1]]
+                key = parent[1] if parent is not None and parent[0] == "{" else None
+                # Arrays remember the key they were opened under
+                self.stack.append([char, key if char == "[" else None])
+            elif char in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if char == "}" and self.capture_start is not None and self._capture_closed():
+                    completed.extend(self._emit_capture())
+                if not self.stack:
+                    self.finished = True
+            self.position += 1
+        self._trim()
+        return completed
+
+    def _capture_closed(self):
+        # The captured object sits directly inside a nodes/links array
+        return bool(self.stack) and self.stack[-1][0] == "[" and self.stack[-1][1] in GRAPH_ARRAYS
+
+    def _emit_capture(self):
+        raw = self.buffer[self.capture_start:self.position + 1]
+        kind = self.capture_kind
+        self.capture_start = None
+        self.capture_kind = None
+        try:
+            return [(kind, json.loads(raw))]
+        except json.JSONDecodeError:
+            logging.warning(f"Skipping malformed {kind} object from LLM: {raw}")
+            return []
+
+    def _trim(self):
+        # Drop scanned text that can no longer be part of a captured object
+        keep_from = self.position
+        if self.capture_start is not None:
+            keep_from = self.capture_start
+        if self.in_string:
+            keep_from = min(keep_from, self.string_start)
+        if keep_from > 0:
+            self.buffer = self.buffer[keep_from:]
+            self.position -= keep_from
+            if self.capture_start is not None:
+                self.capture_start -= keep_from
+            if self.string_start is not None:
+                self.string_start -= keep_from
+
+
+class GraphMerger:
+    """
+    Merges graph nodes with the same normalized name and remaps links to the
+    merged nodes, one object at a time. A merged node's category lists each
+    distinct category once.
+
+    Links may arrive before the nodes they reference; they are held back until
+    both ends are known and dropped by ``finish`` if they never resolve.
+    """
+
+    def __init__(self):
+        self.node_map = {}  # normalized name -> merged node
+        self.categories = {}  # normalized name -> distinct categories
+        self.node_mapping = {}  # original id -> merged id
+        self.nodes = []
+        self.links = []
+        self.pending_links = []
+
+    def add_node(self, node):
+        """
+        Adds a node.
+
+        Returns:
+            list: ``(event, object)`` tuples: ``node`` for a new node,
+            ``node_update`` when it merged into an existing one, and ``link``
+            for held-back links it resolved.
+        """
+        events = []
+        # Read every field first, so an incomplete node changes nothing
+        key, node_id, category = normalize_name(node["name"]), node["id"], node["category"]
+        if key in self.node_map:
+            existing_node = self.node_map[key]
+            self.node_mapping[node_id] = existing_node["id"]
+            categories = self.categories[key]
+            if category not in categories:
+                categories.append(category)
+                existing_node["category"] = ", ".join(categories)
+                events.append(("node_update", existing_node))
+        else:
+            self.node_map[key] = node
+            self.categories[key] = [category]
+            self.nodes.append(node)
+            self.node_mapping[node_id] = node_id
+            events.append(("node", node))
+
+        pending_links, self.pending_links = self.pending_links, []
+        for link in pending_links:
+            events.extend(self.add("link", link))
+        return events
+
+    def add_link(self, link):
+        """Adds a link, returning ``[("link", link)]`` once both ends are known."""
+        relation = link["relation"]  # Incomplete links are rejected before being held back
+        new_source_id = self.node_mapping.get(link["source_id"])
+        new_target_id = self.node_mapping.get(link["target_id"])
+        if new_source_id is None or new_target_id is None:
+            self.pending_links.append(link)
+            return []
+        new_link = {
+            "source_id": new_source_id,
+            "target_id": new_target_id,
+            "relation": relation,
+        }
+        self.links.append(new_link)
+        return [("link", new_link)]
+
+    def add(self, kind, obj):
+        """Adds a parsed ``node`` or ``link`` object."""
+        try:
+            return self.add_node(obj) if kind == "node" else self.add_link(obj)
+        except (KeyError, TypeError) as e:
+            logging.warning(f"Skipping incomplete {kind} from LLM: {obj} ({e})")
+            return []
+
+    def finish(self):
+        """Drops links that still reference unknown nodes and returns the graph."""
+        if self.pending_links:
+            logging.debug(f"Dropping {len(self.pending_links)} unresolved links.")
+        self.pending_links = []
+        return self.nodes, self.links
+
+
+def extract_graph(response_text):
+    """Parses the nodes and links out of a complete LLM response."""
+    parser = GraphStreamParser()
+    nodes, links = [], []
+    for kind, obj in parser.feed(response_text):
+        (nodes if kind == "node" else links).append(obj)
+    return nodes, links
@@ -1,7 +1,17 @@
 # © 2024 Brian Scanlon. All rights reserved.
 
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
 import faiss
 import numpy as np
+from bson import ObjectId
 
 def create_faiss_index(embeddings):
     """Creates a FAISS index for embeddings."""
@@ -16,8 +26,842 @@ def query_index(index, query_embedding, top_k=10):
     """Queries the FAISS index to find top_k similar embeddings."""
     if query_embedding.size == 0:  # Check if query embedding is empty
         raise ValueError("Failed to encode query.")
-    
+
     distances, indices = index.search(np.array(query_embedding), top_k)
     if len(indices[0]) == 0:  # Handle no results case
         raise ValueError("No matching results found.")
     return indices[0]
+
+def query_index_batch(index, query_embeddings, top_k=10):
+    """Queries the FAISS index with a matrix of queries in a single search."""
+    if query_embeddings.size == 0:  # Check if query embeddings are empty
+        raise ValueError("Failed to encode queries.")
+
+    distances, indices = index.search(np.array(query_embeddings), top_k)
+    return indices
+
+
+def build_index(dimension, factory_string="Flat"):
+    """
+    Builds an empty FAISS index that accepts custom ids from a factory string.
+
+    Args:
+        dimension (int): Dimension of the embeddings.
+        factory_string (str): FAISS factory string, e.g. ``Flat``,
+            ``SQfp16``, ``SQ8``, ``IVF1024,Flat``, ``IVF1024,PQ48`` or ``HNSW32``.
+
+    Returns:
+        faiss.Index: The index itself for IVF types, which store external ids
+        natively, or an ``IndexIDMap2`` wrapping any other type.
+    """
+    index = faiss.index_factory(dimension, factory_string)
+    if faiss.try_extract_index_ivf(index) is not None:
+        # An IDMap on top of IVF goes out of sync once vectors are removed
+        return index
+    return faiss.index_factory(dimension, f"IDMap2,{factory_string}")
+
+
+def train_index(index, embeddings, sample_size=100000, seed=0):
+    """Trains the index on a random sample of the embeddings if it needs training."""
+    if index.is_trained:
+        return
+    embeddings = np.asarray(embeddings, dtype="float32")
+    if embeddings.shape[0] > sample_size:
+        rng = np.random.default_rng(seed)
+        embeddings = embeddings[rng.choice(embeddings.shape[0], sample_size, replace=False)]
+    logging.info(f"Training FAISS index on {embeddings.shape[0]} vectors.")
+    try:
+        index.train(embeddings)
+    except RuntimeError as e:
+        raise ValueError(f"Not enough embeddings to train the FAISS index: {e}")
+
+
+def training_minimum(index):
+    """
+    Returns how many vectors an untrained index should be trained on: FAISS
+    wants at least 39 per IVF list and per PQ centroid.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = index.index
+    index = faiss.downcast_index(index)
+    needed = 1
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        needed = max(needed, ivf.nlist * 39)
+    if hasattr(index, "pq"):
+        needed = max(needed, index.pq.ksub * 39)
+    return needed
+
+
+def search_parameter_name(index):
+    """Returns the search-time knob of an index type: nprobe, efSearch or None."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "nprobe"
+    if isinstance(index, faiss.IndexHNSW):
+        return "efSearch"
+    return None
+
+
+def set_search_parameters(index, params):
+    """Applies saved search parameters such as ``{"nprobe": 16}`` to an index."""
+    parameter_space = faiss.ParameterSpace()
+    for name, value in params.items():
+        parameter_space.set_index_parameter(index, name, value)
+
+
+def selector_search_parameters(index, faiss_ids, k):
+    """
+    Builds search parameters restricting a search to ``faiss_ids``.
+
+    IVF indexes keep their nprobe. HNSW skips the vectors outside the subset
+    while it walks the graph, so efSearch is raised in proportion to how few
+    vectors the subset keeps, to still find ``k`` of them.
+    """
+    selector = faiss.IDSelectorBatch(np.asarray(faiss_ids, dtype="int64"))
+    inner = index
+    if isinstance(inner, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        inner = faiss.downcast_index(inner.index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        selectivity = len(faiss_ids) / max(index.ntotal, 1)
+        return faiss.SearchParametersHNSW(
+            sel=selector, efSearch=max(inner.hnsw.efSearch, int(k / selectivity))
+        )
+    return faiss.SearchParameters(sel=selector)
+
+
+def process_rss_bytes():
+    """Returns the resident set size of this process, or None off Linux."""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class ReadWriteLock:
+    """
+    Lock shared by any number of readers or held by a single writer.
+
+    Waiting writers go before new readers, so a stream of searches cannot
+    starve an update. The writer may re-enter the lock, on either side; a
+    reader must not take it again.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._condition:
+            nested = self._writer == me
+            if nested:
+                self._writer_depth += 1
+            else:
+                while self._writer is not None or self._writers_waiting:
+                    self._condition.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                if nested:
+                    self._writer_depth -= 1
+                else:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+class ChunkIndex:
+    """
+    Persistent FAISS index whose vectors are keyed by the chunk ``_id``s
+    written to MongoDB by ``chunking.chunk_text``.
+
+    FAISS only accepts int64 ids, so every chunk ``_id`` is assigned a
+    sequential integer id. The mapping is saved next to the index file, as are
+    the search parameters chosen by ``tune``.
+
+    With ``rescore`` the float32 vectors are also appended to a sidecar file,
+    one row per FAISS id. Searches then fetch ``rescore_factor`` times as many
+    candidates from a compressed index (``SQfp16``, ``SQ8``, ``PQ``) and rank
+    them by exact distance, reading only the candidates' rows through a
+    memory map, so the full-precision vectors stay on disk.
+
+    Searches can be restricted to a set of chunk ids. Subsets of up to
+    ``exact_search_max`` vectors are searched by brute force over their
+    vectors alone, so latency follows the subset size; larger subsets are
+    searched in the index with an id selector.
+
+    FAISS searches are read-only and run concurrently under the shared side
+    of a reader/writer lock; adds, removals and rebuilds take it exclusively.
+    ``request_save`` persists changes after ``save_delay`` seconds instead of
+    rewriting the index on every update.
+
+    Index types that need training (IVF, PQ) buffer added vectors until
+    there are ``training_minimum`` of them. Index types that cannot delete
+    (HNSW) hide removed vectors as tombstones and are compacted in the
+    background once tombstones exceed ``tombstone_compact_fraction`` of the
+    index.
+    """
+
+    def __init__(self, index_dir, dimension, filename="chunks.faiss",
+                 factory_string="Flat", train_sample_size=100000,
+                 rescore=False, rescore_factor=4, exact_search_max=20000, save_delay=0,
+                 tombstone_compact_fraction=0.1):
+        self.index_path = os.path.join(index_dir, filename)
+        self.ids_path = f"{self.index_path}.ids.json"
+        self.params_path = f"{self.index_path}.params.json"
+        self.vectors_path = f"{self.index_path}.vectors.f32"
+        self.dimension = dimension
+        self.factory_string = factory_string
+        self.train_sample_size = train_sample_size
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self.exact_search_max = exact_search_max
+        self._vectors = None
+        self.index = None
+        self.id_to_chunk = {}
+        self.chunk_to_id = {}
+        self.next_id = 0
+        # Ids removed from index types that cannot delete vectors (HNSW)
+        self.tombstones = set()
+        self.tombstone_compact_fraction = tombstone_compact_fraction
+        self._compacting = False
+        self._generation = 0
+        # Vectors waiting until there are enough to train the index on
+        self._pending = {}
+        self._lock = ReadWriteLock()
+        # Debounced saves (see request_save)
+        self.save_delay = save_delay
+        self._save_lock = threading.Lock()
+        self._save_timer_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.chunk_to_id)
+
+    def load(self):
+        """Loads the index from disk, or starts an empty one if none is saved."""
+        with self._lock.write():
+            if os.path.exists(self.index_path) and os.path.exists(self.ids_path):
+                self.index = faiss.read_index(self.index_path)
+                with open(self.ids_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                self.next_id = saved["next_id"]
+                self.id_to_chunk = {int(k): v for k, v in saved["ids"].items()}
+                self.chunk_to_id = {v: k for k, v in self.id_to_chunk.items()}
+                self.tombstones = set(saved.get("tombstones", []))
+                if saved.get("factory_string", "Flat") != self.factory_string:
+                    logging.warning(
+                        f"Saved FAISS index was built as {saved.get('factory_string')!r}, "
+                        f"not {self.factory_string!r}. Run `python indexing.py build` "
+                        "to rebuild it."
+                    )
+                    self.factory_string = saved.get("factory_string", "Flat")
+                self._vectors = None
+                if self.rescore and self._sidecar_rows() < self.next_id:
+                    logging.warning(
+                        f"Rescoring sidecar {self.vectors_path} is missing or incomplete; "
+                        "rescoring is disabled until the index is rebuilt."
+                    )
+                    self.rescore = False
+                logging.info(
+                    f"Loaded FAISS index with {len(self)} vectors from {self.index_path}"
+                )
+            else:
+                self.reset()
+                logging.info("No saved FAISS index found, starting an empty one.")
+
+            self._apply_tuned_parameters(self.index)
+
+    def _apply_tuned_parameters(self, index):
+        if os.path.exists(self.params_path):
+            with open(self.params_path, "r", encoding="utf-8") as f:
+                tuned = json.load(f)
+            set_search_parameters(index, tuned["params"])
+            logging.info(f"Applied tuned search parameters {tuned['params']}")
+
+    def reset(self):
+        """Replaces the index with an empty, untrained one of the configured type."""
+        with self._lock.write():
+            self.index = build_index(self.dimension, self.factory_string)
+            self.id_to_chunk = {}
+            self.chunk_to_id = {}
+            self.tombstones = set()
+            self._pending = {}
+            self._generation += 1
+            self.next_id = 0
+            self._vectors = None
+            if self.rescore:
+                os.makedirs(os.path.dirname(self.vectors_path) or ".", exist_ok=True)
+                open(self.vectors_path, "wb").close()
+
+    def _sidecar_rows(self):
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dimension)
+
+    def _write_vectors(self, first_id, embeddings):
+        """Writes float32 rows for consecutive FAISS ids to the rescoring sidecar."""
+        mode = "r+b" if os.path.exists(self.vectors_path) else "wb"
+        with open(self.vectors_path, mode) as f:
+            f.seek(first_id * 4 * self.dimension)
+            f.write(np.ascontiguousarray(embeddings, dtype="float32").tobytes())
+        self._vectors = None
+
+    def _stored_vectors(self):
+        """Memory-maps the rescoring sidecar; rows are paged in as they are read."""
+        if self._vectors is None:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype="float32", mode="r",
+                shape=(self._sidecar_rows(), self.dimension),
+            )
+        return self._vectors
+
+    def save(self):
+        """
+        Writes the index and its id mapping to disk atomically.
+
+        The index is serialized under the shared lock, so searches keep
+        running, and the files are written after it is released.
+        """
+        with self._save_lock:
+            with self._lock.read():
+                self._dirty = False
+                serialized = faiss.serialize_index(self.index)
+                saved = {
+                    "factory_string": self.factory_string,
+                    "next_id": self.next_id,
+                    "ids": dict(self.id_to_chunk),
+                    "tombstones": sorted(self.tombstones),
+                }
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            serialized.tofile(f"{self.index_path}.tmp")
+            with open(f"{self.ids_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(saved, f)
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+            os.replace(f"{self.ids_path}.tmp", self.ids_path)
+
+    def request_save(self):
+        """
+        Saves the index ``save_delay`` seconds from now, so a burst of adds
+        and removals is written once. Vectors not yet saved when the process
+        dies are re-indexed from MongoDB by the next ``sync``.
+        """
+        if self.save_delay <= 0:
+            self.save()
+            return
+        with self._save_timer_lock:
+            self._dirty = True
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self._save_on_timer)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def _save_on_timer(self):
+        with self._save_timer_lock:
+            self._save_timer = None
+        try:
+            self.save()
+        except Exception:
+            logging.exception("Failed to save the FAISS index.")
+
+    def flush(self):
+        """Writes pending changes now; called at shutdown."""
+        with self._save_timer_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+        if self._dirty:
+            self.save()
+
+    def add(self, chunk_ids, embeddings):
+        """Adds embeddings for the given chunk ids, replacing any already indexed."""
+        chunk_ids = [str(chunk_id) for chunk_id in chunk_ids]
+        if not chunk_ids:
+            return
+        embeddings = np.asarray(embeddings, dtype="float32")
+        if embeddings.shape[0] != len(chunk_ids):
+            raise ValueError("Number of embeddings does not match number of chunk ids.")
+
+        with self._lock.write():
+            if not self.index.is_trained:
+                self._pending.update(zip(chunk_ids, embeddings))
+                needed = training_minimum(self.index)
+                if len(self._pending) < needed:
+                    logging.info(
+                        f"FAISS index needs {needed} vectors to be trained; "
+                        f"{len(self._pending)} are buffered and not searchable yet."
+                    )
+                    return
+                chunk_ids, embeddings = self._take_pending()
+            self.remove([c for c in chunk_ids if c in self.chunk_to_id])
+            ids = np.arange(self.next_id, self.next_id + len(chunk_ids), dtype="int64")
+            if self.rescore:
+                self._write_vectors(self.next_id, embeddings)
+            self.index.add_with_ids(embeddings, ids)
+            for faiss_id, chunk_id in zip(ids.tolist(), chunk_ids):
+                self.id_to_chunk[faiss_id] = chunk_id
+                self.chunk_to_id[chunk_id] = faiss_id
+            self.next_id += len(chunk_ids)
+        logging.debug(f"Added {len(chunk_ids)} vectors to the FAISS index.")
+
+    def _take_pending(self):
+        """Trains the index on the buffered vectors and returns them for adding."""
+        chunk_ids = list(self._pending)
+        embeddings = np.vstack(list(self._pending.values()))
+        self._pending = {}
+        train_index(self.index, embeddings, self.train_sample_size)
+        logging.info(f"Trained FAISS index on {len(chunk_ids)} buffered vectors.")
+        return chunk_ids, embeddings
+
+    def remove(self, chunk_ids):
+        """Removes the vectors of the given chunk ids, ignoring unknown ids."""
+        with self._lock.write():
+            pending = [
+                self._pending.pop(str(chunk_id))
+                for chunk_id in chunk_ids
+                if str(chunk_id) in self._pending
+            ]
+            ids = [
+                self.chunk_to_id.pop(str(chunk_id))
+                for chunk_id in chunk_ids
+                if str(chunk_id) in self.chunk_to_id
+            ]
+            if not ids:
+                return len(pending)
+            for faiss_id in ids:
+                del self.id_to_chunk[faiss_id]
+            try:
+                self.index.remove_ids(np.array(ids, dtype="int64"))
+            except RuntimeError:
+                # HNSW cannot delete vectors; hide them from search results
+                # until the index is compacted
+                self.tombstones.update(ids)
+                if (len(self.tombstones) > self.tombstone_compact_fraction * self.index.ntotal
+                        and not self._compacting):
+                    self._compacting = True
+                    threading.Thread(target=self._compact, daemon=True).start()
+        logging.debug(f"Removed {len(ids)} vectors from the FAISS index.")
+        return len(ids) + len(pending)
+
+    def _compact(self):
+        """
+        Rebuilds an index that cannot delete without its tombstoned vectors.
+
+        The new index is built from a snapshot while searches and updates
+        continue, then vectors added or removed meanwhile are applied to it
+        before it replaces the old one. FAISS ids are kept, so the id maps
+        and the rescoring sidecar stay valid.
+        """
+        try:
+            with self._lock.read():
+                generation = self._generation
+                snapshot_next_id = self.next_id
+                live_ids = np.array(sorted(self.id_to_chunk), dtype="int64")
+                vectors = self.index.reconstruct_batch(live_ids)
+            logging.info(
+                f"Compacting FAISS index: {len(live_ids)} live vectors, "
+                f"{len(self.tombstones)} tombstones."
+            )
+            index = build_index(self.dimension, self.factory_string)
+            train_index(index, vectors, self.train_sample_size)
+            index.add_with_ids(vectors, live_ids)
+            self._apply_tuned_parameters(index)
+
+            with self._lock.write():
+                if generation != self._generation:
+                    return  # Reset or rebuilt meanwhile
+                added = np.array(
+                    [i for i in self.id_to_chunk if i >= snapshot_next_id], dtype="int64"
+                )
+                if len(added):
+                    index.add_with_ids(self.index.reconstruct_batch(added), added)
+                self.tombstones = set(live_ids.tolist()) - set(self.id_to_chunk)
+                self.index = index
+            self.request_save()
+            logging.info("FAISS index compacted.")
+        except Exception:
+            logging.exception("Failed to compact the FAISS index.")
+        finally:
+            self._compacting = False
+
+    def search(self, query_embedding, top_k=10, chunk_ids=None):
+        """
+        Finds the chunks closest to the first query embedding.
+
+        Args:
+            chunk_ids (iterable): Only search these chunks; None searches all.
+
+        Returns:
+            list: ``(chunk_id, distance)`` tuples, closest first.
+        """
+        return self.search_batch(query_embedding[:1], top_k, chunk_ids)[0]
+
+    def search_batch(self, query_embeddings, top_k=10, chunk_ids=None):
+        """
+        Finds the closest chunks for every row of a query matrix with a single
+        FAISS search.
+
+        Args:
+            chunk_ids (iterable): Only search these chunks; None searches all.
+
+        Returns:
+            list: One list of ``(chunk_id, distance)`` tuples per query.
+        """
+        if query_embeddings.size == 0:
+            raise ValueError("Failed to encode query.")
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        with self._lock.read():
+            if len(self) == 0:
+                raise ValueError("No documents have been indexed yet.")
+            if chunk_ids is not None:
+                subset = np.sort(np.array(
+                    [i for i in map(self.chunk_to_id.get, map(str, chunk_ids)) if i is not None],
+                    dtype="int64",
+                ))
+                if len(subset) == 0:
+                    return [[] for _ in query_embeddings]
+                if len(subset) <= self.exact_search_max:
+                    results = self._exact_search(query_embeddings, subset, top_k)
+                    if results is not None:
+                        return results
+                n_candidates = min(
+                    top_k * self.rescore_factor if self.rescore else top_k, len(subset)
+                )
+                distances, indices = self.index.search(
+                    query_embeddings, n_candidates,
+                    params=selector_search_parameters(self.index, subset, n_candidates),
+                )
+            else:
+                n_candidates = top_k * self.rescore_factor if self.rescore else top_k
+                # Compaction keeps tombstones to a small fraction of the
+                # index, so twice the candidates leaves enough live ones
+                distances, indices = self.index.search(
+                    query_embeddings,
+                    min(n_candidates + min(len(self.tombstones), n_candidates),
+                        self.index.ntotal),
+                )
+            results = []
+            for query, row_indices, row_distances in zip(query_embeddings, indices, distances):
+                keep = [
+                    i for i, faiss_id in enumerate(row_indices)
+                    if faiss_id != -1 and faiss_id not in self.tombstones
+                ]
+                row_indices, row_distances = row_indices[keep], row_distances[keep]
+                if self.rescore:
+                    row_indices, row_distances = self._rescore(query, row_indices, top_k)
+                results.append(self._results(row_indices, row_distances, top_k))
+            return results
+
+    def _results(self, faiss_ids, distances, top_k):
+        return [
+            (self.id_to_chunk[faiss_id], float(distance))
+            for faiss_id, distance in zip(faiss_ids.tolist(), distances)
+        ][:top_k]
+
+    def _exact_search(self, query_embeddings, faiss_ids, top_k):
+        """
+        Brute-force search over a subset of the index, reading its vectors from
+        the rescoring sidecar or reconstructing them from the index.
+
+        Returns:
+            list: The results, or None if the index cannot reconstruct vectors
+            (IVF without a direct map).
+        """
+        if self.rescore:
+            vectors = self._stored_vectors()[faiss_ids]
+        else:
+            try:
+                vectors = self.index.reconstruct_batch(faiss_ids)
+            except RuntimeError:
+                return None
+        distances, positions = faiss.knn(
+            query_embeddings, np.ascontiguousarray(vectors, dtype="float32"),
+            min(top_k, len(faiss_ids)), metric=self.index.metric_type,
+        )
+        return [
+            self._results(faiss_ids[row_positions], row_distances, top_k)
+            for row_positions, row_distances in zip(positions, distances)
+        ]
+
+    def _rescore(self, query, faiss_ids, top_k):
+        """Ranks candidate ids by exact distance to the query using the sidecar vectors."""
+        # Sorted ids read the memory map front to back
+        faiss_ids = np.sort(faiss_ids)
+        vectors = self._stored_vectors()[faiss_ids]
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            scores = vectors @ query
+            order = np.argsort(-scores)[:top_k]
+        else:
+            scores = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:top_k]
+        return faiss_ids[order], scores[order]
+
+    def rebuild(self, chunk_ids, embeddings):
+        """
+        Rebuilds the index from scratch, training it on a sample of the
+        embeddings, even if there are fewer than ``training_minimum``.
+        """
+        with self._lock.write():
+            self.reset()
+            self.add(chunk_ids, embeddings)
+            if self._pending:
+                self.add(*self._take_pending())
+
+    def sync(self, chunks_collection, embed_fn, batch_size=256):
+        """
+        Reconciles the index with the ``chunks`` collection: vectors of deleted
+        chunks are removed and chunks that were never indexed are embedded.
+        """
+        stored_ids = {
+            str(doc["_id"]) for doc in chunks_collection.find({}, {"_id": 1})
+        }
+        with self._lock.read():
+            stale = [c for c in [*self.chunk_to_id, *self._pending] if c not in stored_ids]
+            missing = [
+                c for c in stored_ids if c not in self.chunk_to_id and c not in self._pending
+            ]
+        removed = self.remove(stale)
+
+        # An untrained index buffers these until it has enough to train on
+        for start in range(0, len(missing), batch_size):
+            self.add(*load_chunk_embeddings(
+                chunks_collection, embed_fn, missing[start:start + batch_size]
+            ))
+
+        logging.info(
+            f"FAISS index synced: {removed} stale vectors removed, "
+            f"{len(missing)} missing chunks indexed."
+        )
+        return removed, len(missing)
+
+    def memory_report(self):
+        """
+        Reports how much memory the index takes per vector and in total.
+
+        The index is serialized to measure it, which briefly needs as much
+        memory again; use it from the CLI and benchmarks, not per request.
+
+        Returns:
+            dict: Sizes in bytes. ``index_bytes`` is resident for the life of
+            the process; the rescoring sidecar is read from disk on demand.
+        """
+        with self._lock.read():
+            index_bytes = int(faiss.serialize_index(self.index).size)
+            ntotal = self.index.ntotal
+        float32_bytes = 4 * self.dimension
+        bytes_per_vector = index_bytes / ntotal if ntotal else None
+        return {
+            "factory_string": self.factory_string,
+            "vectors": ntotal,
+            "index_bytes": index_bytes,
+            "bytes_per_vector": round(bytes_per_vector, 1) if ntotal else None,
+            "float32_bytes_per_vector": float32_bytes,
+            "compression": round(float32_bytes / bytes_per_vector, 2) if ntotal else None,
+            "rescore": self.rescore,
+            "rescore_sidecar_bytes": (
+                os.path.getsize(self.vectors_path)
+                if self.rescore and os.path.exists(self.vectors_path) else 0
+            ),
+            "process_rss_bytes": process_rss_bytes(),
+        }
+
+
+def load_chunk_embeddings(chunks_collection, embed_fn, chunk_ids=None, batch_size=256):
+    """
+    Loads chunk texts from MongoDB in batches and embeds them.
+
+    Args:
+        chunks_collection: The ``chunks`` collection.
+        embed_fn (callable): Maps a list of texts to an embedding matrix.
+        chunk_ids (list): Chunk ids to load, or None for every chunk.
+        batch_size (int): Number of chunks fetched and embedded at a time.
+
+    Returns:
+        tuple: The list of chunk ids found and their float32 embedding matrix.
+    """
+    if chunk_ids is None:
+        chunk_ids = [doc["_id"] for doc in chunks_collection.find({}, {"_id": 1})]
+    found_ids = []
+    embeddings = []
+    for start in range(0, len(chunk_ids), batch_size):
+        batch = [ObjectId(chunk_id) for chunk_id in chunk_ids[start:start + batch_size]]
+        docs = list(chunks_collection.find({"_id": {"$in": batch}}, {"chunk_text": 1}))
+        if not docs:
+            continue
+        found_ids.extend(str(doc["_id"]) for doc in docs)
+        embeddings.append(
+            np.asarray(embed_fn([doc["chunk_text"] for doc in docs]), dtype="float32")
+        )
+    if not embeddings:
+        return [], np.empty((0, 0), dtype="float32")
+    return found_ids, np.vstack(embeddings)
+
+
+def evaluate_index(index, ground_truth_index, queries, k=10, param_name=None, values=(None,)):
+    """
+    Measures recall@k against an exact index, and per-query latency, for each
+    value of a search parameter.
+
+    Returns:
+        list: One dict per value with ``recall``, ``p50_ms`` and ``p99_ms``.
+    """
+    queries = np.asarray(queries, dtype="float32")
+    _, expected = ground_truth_index.search(queries, k)
+    results = []
+    for value in values:
+        if param_name is not None:
+            set_search_parameters(index, {param_name: value})
+        latencies = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, indices = index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(indices[0])
+        recall = np.mean([
+            len(set(f.tolist()) & set(e.tolist())) / k for f, e in zip(found, expected)
+        ])
+        results.append({
+            "value": value,
+            "recall": float(recall),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+        })
+        logging.info(f"{param_name}={value}: {results[-1]}")
+    return results
+
+
+def tune_index(chunk_index, embeddings, faiss_ids, k=10, n_queries=200,
+               target_recall=0.95, seed=0):
+    """
+    Sweeps nprobe/efSearch on a loaded ChunkIndex and saves the cheapest value
+    that reaches ``target_recall`` next to the index.
+
+    Args:
+        chunk_index (ChunkIndex): The index to tune.
+        embeddings (np.ndarray): The indexed vectors, used for ground truth.
+        faiss_ids (np.ndarray): The FAISS ids of ``embeddings``.
+        k (int): Number of neighbours used for recall@k.
+        n_queries (int): Number of indexed vectors sampled as queries.
+        target_recall (float): Minimum recall@k for a setting to be chosen.
+
+    Returns:
+        dict: The saved tuning record.
+    """
+    ground_truth = faiss.IndexIDMap(faiss.IndexFlatL2(embeddings.shape[1]))
+    ground_truth.add_with_ids(embeddings, faiss_ids)
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)]
+
+    param_name = search_parameter_name(chunk_index.index)
+    if param_name == "nprobe":
+        nlist = faiss.extract_index_ivf(chunk_index.index).nlist
+        values = [v for v in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512) if v <= nlist]
+    elif param_name == "efSearch":
+        values = [16, 32, 64, 128, 256, 512]
+    else:
+        values = [None]
+    sweep = evaluate_index(chunk_index.index, ground_truth, queries, k, param_name, values)
+
+    # Values are increasing in cost, so the first one meeting the target wins
+    chosen = next((r for r in sweep if r["recall"] >= target_recall), sweep[-1])
+    params = {param_name: chosen["value"]} if param_name else {}
+    set_search_parameters(chunk_index.index, params)
+
+    record = {
+        "factory_string": chunk_index.factory_string,
+        "params": params,
+        "k": k,
+        "target_recall": target_recall,
+        "recall": chosen["recall"],
+        "p50_ms": chosen["p50_ms"],
+        "p99_ms": chosen["p99_ms"],
+        "sweep": sweep,
+        "tuned_at": datetime.utcnow().isoformat(),
+    }
+    with open(chunk_index.params_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    return record
+
+
+if __name__ == "__main__":
+    import config
+    from chunking import chunks_collection
+    from vectorising import embed_chunks
+
+    parser = argparse.ArgumentParser(description="Build, tune or measure the chunk FAISS index.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Rebuild the index from MongoDB.")
+    build_parser.add_argument("--factory", default=config.INDEX_FACTORY)
+    tune_parser = subcommands.add_parser("tune", help="Tune nprobe/efSearch on the saved index.")
+    tune_parser.add_argument("--k", type=int, default=10)
+    tune_parser.add_argument("--queries", type=int, default=200)
+    tune_parser.add_argument("--target-recall", type=float, default=0.95)
+    subcommands.add_parser("report", help="Print the memory used by the saved index.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    chunk_index = ChunkIndex(
+        config.INDEX_DIR, config.EMBEDDING_DIMENSION, config.INDEX_FILENAME,
+        factory_string=getattr(args, "factory", config.INDEX_FACTORY),
+        train_sample_size=config.INDEX_TRAIN_SAMPLE_SIZE,
+        rescore=config.INDEX_RESCORE,
+        rescore_factor=config.INDEX_RESCORE_FACTOR,
+        exact_search_max=config.INDEX_FILTER_EXACT_MAX,
+        tombstone_compact_fraction=config.INDEX_TOMBSTONE_COMPACT_FRACTION,
+    )
+
+    if args.command == "build":
+        chunk_ids, embeddings = load_chunk_embeddings(chunks_collection, embed_chunks)
+        chunk_index.rebuild(chunk_ids, embeddings)
+        chunk_index.save()
+        if os.path.exists(chunk_index.params_path):
+            os.remove(chunk_index.params_path)  # Tuned for the previous index
+        print(f"Built {args.factory} index with {len(chunk_index)} vectors.")
+    elif args.command == "report":
+        chunk_index.load()
+        print(json.dumps(chunk_index.memory_report(), indent=2))
+    else:
+        chunk_index.load()
+        chunk_ids = list(chunk_index.chunk_to_id)
+        chunk_ids, embeddings = load_chunk_embeddings(chunks_collection, embed_chunks, chunk_ids)
+        faiss_ids = np.array([chunk_index.chunk_to_id[c] for c in chunk_ids], dtype="int64")
+        record = tune_index(
+            chunk_index, embeddings, faiss_ids, args.k, args.queries, args.target_recall
+        )
+        print(json.dumps({key: record[key] for key in ("params", "recall", "p50_ms", "p99_ms")}))
@@ -0,0 +1,287 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Durable ingestion job queue in MongoDB and the worker pool that drains it.
+
+``/document`` only spools the upload and enqueues a job. Workers claim jobs
+atomically with ``find_one_and_update``, highest priority first, and hold a
+lease that they renew while they run. A job whose lease runs out (its worker died or the
+service restarted) becomes claimable again, so no job is lost. Failed jobs
+are retried with a backoff until they run out of attempts.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from executors import run_io
+
+
+class JobQueue:
+    """
+    Ingestion jobs stored in the ``jobs`` collection.
+
+    A job document holds its ``status`` (queued, running, succeeded or
+    failed), ``priority``, ``attempts``, the ``payload`` the handler needs,
+    per-stage timings under ``stages`` and, once finished, its ``result`` or
+    ``error``.
+    """
+
+    def __init__(self, db, max_attempts=3, retry_backoff_seconds=10, lease_seconds=900):
+        self.collection = db["jobs"]
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.lease_seconds = lease_seconds
+
+    def ensure_indexes(self):
+        self.collection.create_index([("status", 1), ("priority", -1), ("created_at", 1)])
+        self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+
+    def enqueue(self, payload, priority=0):
+        """
+        Adds a job to the queue.
+
+        Args:
+            payload (dict): Handler input, e.g. the spooled upload's path.
+            priority (int): Jobs with a higher priority are claimed first.
+
+        Returns:
+            ObjectId: The id of the new job.
+        """
+        now = datetime.utcnow()
+        result = self.collection.insert_one({
+            "status": "queued",
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "payload": payload,
+            "stages": {},
+            "created_at": now,
+            "run_after": now,
+        })
+        return result.inserted_id
+
+    def claim(self, worker_id):
+        """
+        Atomically takes the next runnable job, or returns None.
+
+        Queued jobs whose retry delay has passed are runnable, and so are
+        running jobs whose lease has expired.
+        """
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued", "run_after": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def update(self, job_id, fields):
+        """Sets fields on a job and renews its lease."""
+        fields = dict(fields)
+        fields["lease_expires_at"] = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        self.collection.update_one({"_id": job_id}, {"$set": fields})
+
+    def renew_lease(self, job_id, worker_id):
+        """
+        Extends the lease of a running job held by ``worker_id``.
+
+        Returns:
+            bool: False if the job finished or another worker reclaimed it.
+        """
+        result = self.collection.update_one(
+            {"_id": job_id, "status": "running", "worker": worker_id},
+            {"$set": {
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+            }},
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id, result):
+        self.collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "succeeded",
+                    "result": result,
+                    "finished_at": datetime.utcnow(),
+                },
+                "$unset": {"lease_expires_at": "", "stage": ""},
+            },
+        )
+
+    def fail(self, job, error):
+        """
+        Records a failed attempt.
+
+        Returns:
+            bool: True if the job was requeued, False if it failed for good.
+        """
+        now = datetime.utcnow()
+        if job["attempts"] < job["max_attempts"]:
+            # Back off linearly with the number of attempts so far
+            delay = self.retry_backoff_seconds * job["attempts"]
+            fields = {"status": "queued", "run_after": now + timedelta(seconds=delay)}
+        else:
+            fields = {"status": "failed", "finished_at": now}
+        fields["error"] = str(error)
+        self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": fields, "$unset": {"lease_expires_at": "", "stage": ""}},
+        )
+        return fields["status"] == "queued"
+
+    def get(self, job_id):
+        """Returns a job as a JSON-serializable dict, or None."""
+        job = self.collection.find_one({"_id": job_id}, {"payload": 0})
+        if job is not None:
+            for field, value in job.items():
+                if isinstance(value, ObjectId):
+                    job[field] = str(value)
+        return job
+
+    def stats(self):
+        pipeline = [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        return {doc["_id"]: doc["count"] for doc in self.collection.aggregate(pipeline)}
+
+
+class IngestionWorkers:
+    """
+    Pool of asyncio workers that run claimed jobs through a handler.
+
+    The handler is an async callable ``handler(job, stage)``; ``stage(name)``
+    is an async context manager that records the stage's start, end and
+    duration on the job document. The job's lease is renewed every third of
+    the lease period while the handler runs, so a long stage is not mistaken
+    for a dead worker. The optional blocking ``cleanup(job)`` runs once a job
+    has succeeded or failed for good.
+    """
+
+    def __init__(self, queue, handler, concurrency=2, poll_interval=1.0, cleanup=None):
+        self.queue = queue
+        self.handler = handler
+        self.cleanup = cleanup
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup = None
+        self._tasks = []
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        prefix = uuid.uuid4().hex[:8]
+        self._tasks = [
+            asyncio.create_task(self._run(f"{prefix}-{i}")) for i in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wakes idle workers after a job was enqueued by this process."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self, worker_id):
+        while True:
+            try:
+                job = await run_io(self.queue.claim, worker_id)
+            except Exception as e:
+                logging.error(f"Worker {worker_id} failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(job)
+
+    async def _process(self, job):
+        job_id = job["_id"]
+
+        @asynccontextmanager
+        async def stage(name):
+            started = time.perf_counter()
+            await run_io(self.queue.update, job_id, {
+                "stage": name,
+                f"stages.{name}": {"status": "running", "started_at": datetime.utcnow()},
+            })
+            try:
+                yield
+            except Exception:
+                await run_io(self.queue.update, job_id, {f"stages.{name}.status": "failed"})
+                raise
+            await run_io(self.queue.update, job_id, {
+                f"stages.{name}.status": "done",
+                f"stages.{name}.finished_at": datetime.utcnow(),
+                f"stages.{name}.seconds": time.perf_counter() - started,
+            })
+
+        if job["attempts"] > job["max_attempts"]:
+            # Reclaimed after its lease expired on the final attempt
+            await run_io(self.queue.fail, job, "Job lease expired on its final attempt.")
+            await self._cleanup(job)
+            return
+
+        logging.info(f"Running ingestion job {job_id}, attempt {job['attempts']}.")
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handler(job, stage)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            requeued = await run_io(self.queue.fail, job, e)
+            logging.error(
+                f"Ingestion job {job_id} failed: {e}. "
+                f"{'Retrying later.' if requeued else 'Giving up.'}"
+            )
+            if not requeued:
+                await self._cleanup(job)
+            return
+        finally:
+            heartbeat.cancel()
+        await run_io(self.queue.complete, job_id, result)
+        await self._cleanup(job)
+        logging.info(f"Ingestion job {job_id} succeeded.")
+
+    async def _heartbeat(self, job):
+        interval = self.queue.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await run_io(self.queue.renew_lease, job["_id"], job["worker"])
+            except Exception as e:
+                logging.warning(f"Failed to renew the lease of ingestion job {job['_id']}: {e}")
+                continue
+            if not renewed:
+                logging.warning(f"Ingestion job {job['_id']} lost its lease.")
+                return
+
+    async def _cleanup(self, job):
+        if self.cleanup is None:
+            return
+        try:
+            await run_io(self.cleanup, job)
+        except Exception as e:
+            logging.warning(f"Cleanup of ingestion job {job['_id']} failed: {e}")
@@ -0,0 +1,120 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Process-wide registry of embedding models and tokenizers.
+
+Every model is loaded on first use, exactly once per process, and shared by
+ingestion and query embedding, so chunks and queries are always embedded by
+the same model. EMBEDDING_BACKEND selects PyTorch sentence-transformers or
+an ONNX Runtime export of the same model. Importing this module loads nothing.
+"""
+import logging
+import os
+import threading
+import time
+
+import config
+
+_models = {}
+_tokenizers = {}
+_lock = threading.Lock()
+
+
+def get_model(name=None):
+    """
+    Returns a sentence-transformer model, loading it on first use.
+
+    Args:
+        name (str): Model name (default: EMBEDDING_MODEL).
+
+    Returns:
+        SentenceTransformer | OnnxEmbedder: The shared model instance.
+    """
+    name = name or config.EMBEDDING_MODEL
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                model = _load_model(name)
+                _models[name] = model
+                logging.info(
+                    f"Loaded model {name} ({model_key(name)}) "
+                    f"in {time.perf_counter() - started:.2f}s."
+                )
+    return model
+
+
+def _load_model(name):
+    if config.EMBEDDING_BACKEND == "onnx":
+        import onnx_embedder
+
+        model_dir = onnx_embedder.onnx_model_dir(name)
+        required = (
+            onnx_embedder.QUANTIZED_MODEL_FILENAME if config.ONNX_QUANTIZE
+            else onnx_embedder.METADATA_FILENAME
+        )
+        if not os.path.exists(os.path.join(model_dir, required)):
+            logging.info(f"No ONNX export of {name} yet, exporting it.")
+            onnx_embedder.export_model(name, model_dir, quantize=config.ONNX_QUANTIZE)
+        return onnx_embedder.OnnxEmbedder(
+            model_dir,
+            quantized=config.ONNX_QUANTIZE,
+            intra_op_threads=config.ONNX_INTRA_OP_THREADS,
+            batch_size=config.EMBEDDING_BATCH_SIZE,
+        )
+    if config.EMBEDDING_BACKEND == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(name)
+    raise ValueError(f"Unknown embedding backend: {config.EMBEDDING_BACKEND}")
+
+
+def model_key(name=None):
+    """
+    Identifies the embeddings a model produces under the configured backend,
+    e.g. for cache keys. Quantized ONNX embeddings differ slightly from the
+    PyTorch ones, so they get their own key.
+    """
+    name = name or config.EMBEDDING_MODEL
+    if config.EMBEDDING_BACKEND == "onnx" and config.ONNX_QUANTIZE:
+        return f"{name}@onnx-int8"
+    return name
+
+
+def encode(texts, name=None):
+    """Embeds a list of texts with a registry model."""
+    return get_model(name).encode(texts, batch_size=config.EMBEDDING_BATCH_SIZE)
+
+
+def get_tokenizer(name=None):
+    """
+    Returns a Hugging Face tokenizer, loading it on first use.
+
+    Args:
+        name (str): Tokenizer name; empty returns the embedding model's own.
+    """
+    if not name:
+        return get_model().tokenizer
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        with _lock:
+            tokenizer = _tokenizers.get(name)
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                _tokenizers[name] = tokenizer
+    return tokenizer
+
+
+def is_loaded(name=None):
+    return (name or config.EMBEDDING_MODEL) in _models
+
+
+def warm_up():
+    """Loads the embedding model and context tokenizer and runs one encode."""
+    started = time.perf_counter()
+    encode(["warm-up"])
+    get_tokenizer(config.CONTEXT_TOKENIZER)
+    logging.info(f"Warmed up models in {time.perf_counter() - started:.2f}s.")
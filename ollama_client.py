@@ -0,0 +1,188 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import asyncio
+import json
+import logging
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+import config
+
+
+class OllamaClient:
+    """
+    Shared async client for the Ollama generate API.
+
+    One keep-alive connection pool is reused by every request. At most
+    ``max_in_flight`` generations run at once; up to ``max_queue`` more may
+    wait for a slot, and anything beyond that is rejected straight away with
+    a 503 so callers can back off instead of piling up.
+    """
+
+    def __init__(self, base_url, max_in_flight=2, max_queue=32,
+                 connect_timeout=5.0, read_timeout=300.0, max_connections=16):
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = None
+        self._client = None
+
+    def _get_client(self):
+        # Created lazily so the pool belongs to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, limits=self.limits
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            logging.warning("Ollama wait queue is full, rejecting request.")
+            raise HTTPException(
+                status_code=503,
+                detail="The language model is busy, please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def generate(self, payload):
+        """Runs a non-streaming generation and returns Ollama's JSON response."""
+        await self._acquire()
+        try:
+            response = await self._get_client().post(
+                "/api/generate", json={**payload, "stream": False}
+            )
+        except httpx.TimeoutException as e:
+            logging.error(f"Timed out waiting for the RAG API: {e}")
+            raise HTTPException(status_code=504, detail="RAG API timed out")
+        except httpx.HTTPError as e:
+            logging.error(f"Error calling the RAG API: {e}")
+            raise HTTPException(status_code=500, detail="Failed to connect to RAG API")
+        finally:
+            self._release()
+
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Failed to connect to RAG API")
+        return response.json()
+
+    async def open_stream(self, payload):
+        """
+        Reserves a generation slot and starts a streaming generation.
+
+        Errors (including a full queue) are raised here, before any bytes are
+        sent to the caller's client. The returned ``GenerationStream`` yields
+        each decoded JSON line and frees the slot when it finishes or is
+        closed; serve it with ``GenerationResponse`` so that it is closed even
+        if the client goes away before the stream is read.
+        """
+        await self._acquire()
+        try:
+            client = self._get_client()
+            request = client.build_request(
+                "POST", "/api/generate", json={**payload, "stream": True}
+            )
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            self._release()
+            logging.error(f"Error calling the RAG API: {e}")
+            raise HTTPException(status_code=500, detail="Failed to connect to RAG API")
+
+        if response.status_code != 200:
+            await response.aclose()
+            self._release()
+            raise HTTPException(status_code=500, detail="Failed to connect to RAG API")
+        return GenerationStream(response, self._release)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
+
+
+class GenerationStream:
+    """Decoded JSON lines of a streaming generation, holding its slot until closed."""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+        self._closed = False
+
+    async def __aiter__(self):
+        try:
+            async for line in self._response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """Closes the Ollama response and frees the slot; safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._response.aclose()
+        finally:
+            self._release()
+
+
+class GenerationResponse(StreamingResponse):
+    """
+    Streams content derived from a ``GenerationStream`` and closes the stream
+    however the response ends, including a client that disconnects before
+    the first byte (when the content iterator never starts).
+    """
+
+    def __init__(self, content, stream, **kwargs):
+        super().__init__(content, **kwargs)
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stream.aclose()
+
+
+ollama_client = OllamaClient(
+    config.OLLAMA_URL,
+    max_in_flight=config.OLLAMA_MAX_IN_FLIGHT,
+    max_queue=config.OLLAMA_MAX_QUEUE,
+    connect_timeout=config.OLLAMA_CONNECT_TIMEOUT,
+    read_timeout=config.OLLAMA_READ_TIMEOUT,
+    max_connections=config.OLLAMA_MAX_CONNECTIONS,
+)
@@ -0,0 +1,212 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Sentence embeddings with ONNX Runtime instead of PyTorch.
+
+``export_model`` exports a sentence-transformer's transformer to ONNX, with
+an optional dynamically int8-quantized copy, and records its pooling and
+normalisation. ``OnnxEmbedder`` runs the export on CPU and applies the same
+pooling, so its embeddings match ``SentenceTransformer.encode``.
+
+Usage (from the repository root):
+    python onnx_embedder.py export --quantize
+"""
+import argparse
+import inspect
+import json
+import logging
+import os
+
+import numpy as np
+
+import config
+
+METADATA_FILENAME = "embedder.json"
+MODEL_FILENAME = "model.onnx"
+QUANTIZED_MODEL_FILENAME = "model.int8.onnx"
+
+
+def export_model(model_name, output_dir, quantize=False, opset_version=17):
+    """
+    Exports a sentence-transformer model to ONNX. Needs PyTorch.
+
+    Args:
+        model_name (str): Name or path of the sentence-transformer model.
+        output_dir (str): Directory for the ONNX models, tokenizer and metadata.
+        quantize (bool): Also write a dynamically int8-quantized model.
+        opset_version (int): ONNX opset to export with.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling = next(module for module in model if isinstance(module, Pooling))
+    # Newer sentence-transformers expose the mode directly, older ones via a getter
+    pooling_mode = getattr(pooling, "pooling_mode", None)
+    if not isinstance(pooling_mode, str):
+        pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling_mode}")
+
+    tokenizer = model.tokenizer
+    input_names = [
+        name for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in tokenizer.model_input_names
+    ]
+
+    class TokenEmbeddings(torch.nn.Module):
+        """The transformer alone, returning its last hidden state."""
+
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    sample = tokenizer(["An example sentence."], return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+    module = TokenEmbeddings(transformer.auto_model).eval()
+    export_options = {}
+    # torch 2.5 added the dynamo exporter, and later releases default to it;
+    # older releases only have the TorchScript exporter and no such argument
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_options["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            tuple(sample[name] for name in input_names),
+            os.path.join(output_dir, MODEL_FILENAME),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            **export_options,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            os.path.join(output_dir, MODEL_FILENAME),
+            os.path.join(output_dir, QUANTIZED_MODEL_FILENAME),
+            weight_type=QuantType.QInt8,
+        )
+
+    # get_sentence_embedding_dimension was renamed in newer sentence-transformers
+    dimension = getattr(
+        model, "get_embedding_dimension", model.get_sentence_embedding_dimension
+    )()
+    with open(os.path.join(output_dir, METADATA_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "model_name": model_name,
+                "pooling": pooling_mode,
+                "normalize": any(isinstance(module, Normalize) for module in model),
+                "max_seq_length": model.max_seq_length,
+                "dimension": dimension,
+                "input_names": input_names,
+            },
+            f,
+            indent=2,
+        )
+    logging.info(f"Exported {model_name} to ONNX in {output_dir}.")
+
+
+class OnnxEmbedder:
+    """
+    Embeds sentences with an exported model on ONNX Runtime.
+
+    Offers the parts of the ``SentenceTransformer`` interface the service
+    uses: ``encode``, ``tokenizer``, ``max_seq_length`` and
+    ``get_sentence_embedding_dimension``.
+    """
+
+    def __init__(self, model_dir, quantized=False, intra_op_threads=0, batch_size=32):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, METADATA_FILENAME), "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self.max_seq_length = self.metadata["max_seq_length"]
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        filename = QUANTIZED_MODEL_FILENAME if quantized else MODEL_FILENAME
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, filename), options, providers=["CPUExecutionProvider"]
+        )
+
+    def get_sentence_embedding_dimension(self):
+        return self.metadata["dimension"]
+
+    def _encode_batch(self, sentences):
+        # Padded to the longest sentence in the batch, not to max_seq_length
+        encoded = self.tokenizer(
+            sentences,
+            padding="longest",
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feed = {name: encoded[name].astype("int64") for name in self.metadata["input_names"]}
+        token_embeddings = self.session.run(None, feed)[0]
+
+        if self.metadata["pooling"] == "cls":
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = feed["attention_mask"][..., None].astype("float32")
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(
+                mask.sum(axis=1), 1e-9, None
+            )
+        if self.metadata["normalize"]:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype("float32")
+
+    def encode(self, sentences, batch_size=None):
+        """
+        Embeds a list of sentences.
+
+        Sentences are batched in order of length so each batch carries little
+        padding; the embeddings are returned in input order.
+
+        Returns:
+            np.ndarray: A ``(len(sentences), dimension)`` float32 array.
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        batch_size = batch_size or self.batch_size
+        dimension = self.get_sentence_embedding_dimension()
+        embeddings = np.zeros((len(sentences), dimension), dtype="float32")
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([sentences[i] for i in batch])
+        return embeddings[0] if single else embeddings
+
+
+def onnx_model_dir(model_name):
+    """Returns the directory holding the ONNX export of a model."""
+    return os.path.join(config.ONNX_MODEL_DIR, model_name.strip("/").replace("/", "--"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export_parser = subcommands.add_parser("export", help="Export the model to ONNX.")
+    export_parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    export_parser.add_argument("--output-dir", help="Default: under ONNX_MODEL_DIR.")
+    export_parser.add_argument("--quantize", action="store_true", help="Also write an int8 model.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export_model(args.model, args.output_dir or onnx_model_dir(args.model), args.quantize)
@@ -1,87 +1,256 @@
+import codecs
 import logging
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF for PDF handling
 import docx  # python-docx for DOCX handling
 import io
+import config
 
+# Bytes of a memory-mapped text file decoded per step
+TXT_DECODE_BLOCK_SIZE = 1 << 20
 
-def extract_tables_from_page(page_text):
+# Process pool for page-parallel PDF extraction, created on first use
+_pdf_pool = None
+_pdf_pool_size = 0
+_pdf_pool_lock = threading.Lock()
+
+
+def page_text_from_dict(page_dict):
+    """
+    Rebuilds a page's plain text from its ``get_text("dict")`` representation.
+
+    Produces the same string as ``page.get_text("text")``: one line of span
+    text per layout line, with text blocks in reading order.
+    """
+    parts = []
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:  # Skip image blocks
+            continue
+        for line in block["lines"]:
+            parts.append("".join(span["text"] for span in line["spans"]))
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _page_cells(page_dict):
+    """
+    Splits the page's lines into cells: runs of spans without a gap wider than
+    the font size between them. Returns (x0, y0, x1, y1, text) tuples.
     """
-    Extracts simple table-like structures from page text.
+    cells = []
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            cell = None
+            for span in line["spans"]:
+                x0, y0, x1, y1 = span["bbox"]
+                if cell is not None and x0 - cell[2] <= span["size"]:
+                    cell = (cell[0], min(cell[1], y0), x1, max(cell[3], y1), cell[4] + span["text"])
+                else:
+                    if cell is not None:
+                        cells.append(cell)
+                    cell = (x0, y0, x1, y1, span["text"])
+            if cell is not None:
+                cells.append(cell)
+    return [cell for cell in cells if cell[4].strip()]
+
+
+def extract_tables_from_page(page_dict, row_tolerance=3.0, column_tolerance=4.0):
+    """
+    Extracts table-like structures from a page's layout.
+
+    Cells whose vertical centres lie within ``row_tolerance`` points form a
+    row. Consecutive rows with the same number of cells, whose columns line
+    up on their left or right edges within ``column_tolerance`` points, form
+    a table.
 
     Args:
-        page_text (str): The text content of a PDF page.
+        page_dict (dict): The page as returned by ``page.get_text("dict")``.
+        row_tolerance (float): Maximum vertical offset of cells in one row.
+        column_tolerance (float): Maximum horizontal offset of aligned columns.
 
     Returns:
         list: A list of table-like structures, each represented as a list of rows.
     """
     tables = []
     try:
-        # Split text into lines
-        lines = page_text.splitlines()
+        # Group cells into rows by their vertical centre
+        rows = []
+        for cell in sorted(_page_cells(page_dict), key=lambda c: (c[1] + c[3]) / 2):
+            centre = (cell[1] + cell[3]) / 2
+            if rows and abs(centre - rows[-1][0]) <= row_tolerance:
+                rows[-1][1].append(cell)
+            else:
+                rows.append((centre, [cell]))
+        rows = [sorted(cells) for _, cells in rows]
+
+        def aligned(row, previous):
+            return len(row) == len(previous) and all(
+                abs(a[0] - b[0]) <= column_tolerance or abs(a[2] - b[2]) <= column_tolerance
+                for a, b in zip(row, previous)
+            )
 
-        # Look for lines with consistent column-like spacing (e.g., using tabs or multiple spaces)
         table = []
-        for line in lines:
-            # Detect potential table rows (e.g., lines with multiple spaces or tab delimiters)
-            if "\t" in line or "  " in line:
-                # Split the row into columns based on tabs or spaces
-                columns = line.split("\t") if "\t" in line else line.split()
-                table.append(columns)
-            elif (
-                table
-            ):  # If we find a line not part of the table, save the current table
+        for row in rows:
+            if len(row) >= 2 and (not table or aligned(row, table[-1])):
+                table.append(row)
+                continue
+            if len(table) >= 2:
                 tables.append(table)
-                table = []  # Reset for the next table
-
-        # Append the last table if still active
-        if table:
+            # A multi-cell row that breaks alignment may start the next table
+            table = [row] if len(row) >= 2 else []
+        if len(table) >= 2:
             tables.append(table)
 
     except Exception as e:
         logging.warning(f"Failed to extract tables from page: {e}")
 
-    return tables
+    return [[[cell[4].strip() for cell in row] for row in table] for table in tables]
+
+
+def _extract_page(page, page_num, detect_tables=True):
+    """
+    Returns the text and tables of a PDF page from a single layout pass.
+
+    With ``detect_tables`` the page is laid out once as a dict, which yields
+    both the text and the table candidates; without it only the plain text is
+    extracted.
+    """
+    page_text = ""
+    tables = []
+    try:
+        if detect_tables:
+            page_dict = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)
+            page_text = page_text_from_dict(page_dict)
+            tables = extract_tables_from_page(page_dict)
+        else:
+            page_text = page.get_text("text")
+        logging.debug(f"Extracted page {page_num + 1}")
+    except Exception as e:
+        logging.warning(f"Failed to extract page {page_num + 1}: {e}")
+
+    return page_text, tables
+
+
+def _extract_page_range(path, start, end, detect_tables=True):
+    """
+    Extracts pages ``start`` to ``end`` (exclusive) of a PDF in a worker process.
+
+    Each worker opens the document itself, so only the path and the extracted
+    results cross the process boundary.
+    """
+    texts = []
+    tables = []
+    with fitz.open(path, filetype="pdf") as doc:
+        for page_num in range(start, end):
+            page_text, page_tables = _extract_page(
+                doc.load_page(page_num), page_num, detect_tables
+            )
+            texts.append(page_text)
+            tables.append(page_tables)
+    return texts, tables
 
 
-def process_pdf(file_content):
+def _page_ranges(page_count, parts):
+    """Splits page numbers into ``parts`` contiguous ranges of near-equal size."""
+    size, remainder = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _get_pdf_pool(workers):
+    global _pdf_pool, _pdf_pool_size
+    # Documents are parsed on several CPU threads; only one may create the pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_size != workers:
+            if _pdf_pool is not None:
+                _pdf_pool.shutdown(wait=False)
+            # Spawned workers import only this module, not the models loaded by the app
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pdf_pool_size = workers
+        return _pdf_pool
+
+
+def process_pdf(file_content, workers=None, detect_tables=None):
+    """
+    Extracts metadata, text and tables from a PDF.
+
+    Args:
+        file_content (bytes | str): The PDF content, or the path of a PDF file.
+        workers (int): Processes extracting page ranges in parallel (default:
+            PDF_EXTRACTION_WORKERS). Parallel extraction needs a path; bytes
+            are always extracted in this process.
+        detect_tables (bool): Whether to look for tables (default:
+            PDF_DETECT_TABLES). Text-only ingestion can skip it.
+
+    Returns:
+        dict: "metadata", "text" (pages joined in order) and "tables" (one list
+        per page), or None on failure.
+    """
     logging.debug("Starting PDF processing.")
+    if workers is None:
+        workers = config.PDF_EXTRACTION_WORKERS
+    if detect_tables is None:
+        detect_tables = config.PDF_DETECT_TABLES
     try:
-        # Open the PDF from binary content using a BytesIO stream
-        doc = fitz.open("pdf", io.BytesIO(file_content))
+        if isinstance(file_content, (bytes, bytearray)):
+            # Open the PDF from binary content using a BytesIO stream
+            doc = fitz.open("pdf", io.BytesIO(file_content))
+        else:
+            # Open from the path so pages are read from disk on demand
+            doc = fitz.open(file_content, filetype="pdf")
         metadata = doc.metadata  # Extract metadata
         logging.debug(f"Extracted metadata: {metadata}")
+        page_count = doc.page_count
 
-        # Initialize extracted data structure
-        extracted_data = {"metadata": metadata, "text": "", "tables": []}
-
-        # Iterate over pages in the PDF
-        for page_num in range(doc.page_count):
-            logging.debug(f"Processing page {page_num + 1}/{doc.page_count}")
-            page = doc.load_page(page_num)
-
-            # Extract plain text
-            try:
-                page_text = page.get_text("text")
-                extracted_data["text"] += page_text
-                logging.debug(f"Extracted text from page {page_num + 1}")
-            except Exception as e:
-                logging.warning(f"Failed to extract text from page {page_num + 1}: {e}")
-
-            # Extract structured text for tables
-            try:
-                page_dict = page.get_text("dict")
-                tables = extract_tables_from_page(page_dict)
-                extracted_data["tables"].append(tables)
-                logging.debug(f"Extracted tables from page {page_num + 1}")
-            except Exception as e:
-                logging.warning(
-                    f"Failed to extract tables from page {page_num + 1}: {e}"
+        parallel = (
+            workers > 1
+            and not isinstance(file_content, (bytes, bytearray))
+            and page_count >= workers * config.PDF_MIN_PAGES_PER_WORKER
+        )
+        page_texts = []
+        page_tables = []
+        if parallel:
+            doc.close()
+            ranges = _page_ranges(page_count, workers)
+            logging.debug(f"Extracting {page_count} pages in {workers} processes")
+            results = _get_pdf_pool(workers).map(
+                _extract_page_range,
+                [file_content] * len(ranges),
+                [start for start, _ in ranges],
+                [end for _, end in ranges],
+                [detect_tables] * len(ranges),
+            )
+            # map yields in submission order, which keeps pages in order
+            for texts, tables in results:
+                page_texts.extend(texts)
+                page_tables.extend(tables)
+        else:
+            # Iterate over pages in the PDF
+            for page_num in range(page_count):
+                logging.debug(f"Processing page {page_num + 1}/{page_count}")
+                page_text, tables = _extract_page(
+                    doc.load_page(page_num), page_num, detect_tables
                 )
+                page_texts.append(page_text)
+                page_tables.append(tables)
+            # Close the document
+            doc.close()
 
-        # Close the document
-        doc.close()
         logging.debug("Completed PDF processing.")
-        return extracted_data
+        return {"metadata": metadata, "text": "".join(page_texts), "tables": page_tables}
 
     except Exception as e:
         logging.error(f"Error processing PDF: {e}")
@@ -91,10 +260,10 @@ def process_pdf(file_content):
 def process_docx(file_content):
     logging.debug("Starting DOCX processing.")
     try:
-        # Load DOCX content from bytes
-        from io import BytesIO
-
-        doc = docx.Document(BytesIO(file_content))
+        # Load DOCX content from bytes or a path
+        if isinstance(file_content, (bytes, bytearray)):
+            file_content = io.BytesIO(file_content)
+        doc = docx.Document(file_content)
         full_text = [para.text for para in doc.paragraphs]
         return {"text": "\n".join(full_text).strip()}
     except Exception as e:
@@ -102,10 +271,38 @@ def process_docx(file_content):
         return None
 
 
+def read_text_file(path, encoding="utf-8"):
+    """
+    Decodes a text file through a memory map, one block at a time.
+
+    Only the decoded text is held in memory, never a second full copy of the
+    raw bytes.
+
+    Args:
+        path (str): Path of the text file.
+        encoding (str): Text encoding of the file.
+
+    Returns:
+        str: The decoded text.
+    """
+    if os.path.getsize(path) == 0:
+        return ""  # Empty files cannot be memory-mapped
+    decoder = codecs.getincrementaldecoder(encoding)()
+    parts = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for offset in range(0, len(mapped), TXT_DECODE_BLOCK_SIZE):
+            parts.append(decoder.decode(mapped[offset:offset + TXT_DECODE_BLOCK_SIZE]))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
 def process_txt(file_content):
     logging.debug("Starting TXT processing.")
     try:
-        text = file_content.decode("utf-8").strip()
+        if isinstance(file_content, (bytes, bytearray)):
+            text = file_content.decode("utf-8").strip()
+        else:
+            text = read_text_file(file_content).strip()
         return {"text": text} if text else None
     except Exception as e:
         logging.error(f"Error processing TXT: {e}")
@@ -113,6 +310,16 @@ def process_txt(file_content):
 
 
 def process_document(file, file_extension):
+    """
+    Extracts text from a document.
+
+    Args:
+        file (bytes | str): The document content, or the path of a file holding it.
+        file_extension (str): One of "pdf", "docx" or "txt".
+
+    Returns:
+        dict: The extracted data with at least a "text" key, or None on failure.
+    """
     logging.debug(f"Processing document of type: {file_extension}")
     try:
         if file_extension == "pdf":
@@ -0,0 +1,90 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import asyncio
+import logging
+from collections import Counter
+
+
+class BatchingEncoder:
+    """
+    Collects query encodes from concurrent requests into micro-batches.
+
+    The first query to arrive opens a batch; the batch is encoded as soon as
+    ``max_batch_size`` queries are waiting or ``max_wait_ms`` has passed,
+    whichever comes first. Each caller gets back its own embedding row.
+    """
+
+    def __init__(self, encode, max_wait_ms=5, max_batch_size=32, executor=None):
+        self.encode_batch = encode
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self.batch_sizes = Counter()
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        """Starts the background batching task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def encode(self, text):
+        """Encodes a single query and returns its embedding row."""
+        if self._task is None:
+            raise RuntimeError("BatchingEncoder has not been started.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batch_sizes[len(batch)] += 1
+            logging.debug(f"Encoding a batch of {len(batch)} queries.")
+            try:
+                embeddings = await loop.run_in_executor(
+                    self.executor, self.encode_batch, [text for text, _ in batch]
+                )
+            except Exception as e:
+                logging.error(f"Error encoding query batch: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    def stats(self):
+        """Returns the batch size histogram and the settings it was built with."""
+        batches = sum(self.batch_sizes.values())
+        queries = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": batches,
+            "queries": queries,
+            "mean_batch_size": queries / batches if batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
@@ -0,0 +1,163 @@
+# © 2024 Brian Scanlon. All rights reserved.
+
+import asyncio
+import copy
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Result of an in-flight generation whose leading request was cancelled
+LEADER_CANCELLED = object()
+
+
+class SemanticResponseCache:
+    """
+    Caches generated answers by query meaning and retrieved context.
+
+    A cached answer is reused when a new query retrieves exactly the same set
+    of chunk ids and its embedding has cosine similarity of at least
+    ``similarity_threshold`` with the cached query. Entries expire after
+    ``ttl_seconds``, the least recently used entry is evicted beyond
+    ``max_entries``, and every entry built on a chunk is dropped when that
+    chunk changes. Identical requests that arrive while an answer is being
+    generated wait for that generation instead of starting their own.
+    """
+
+    def __init__(self, similarity_threshold=0.95, ttl_seconds=3600, max_entries=1024):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidated = 0
+        self._entries = OrderedDict()  # entry id -> entry, least recently used first
+        self._by_context = {}  # frozenset of chunk ids -> entry ids
+        self._by_chunk = {}  # chunk id -> entry ids
+        self._in_flight = {}  # (query, context) -> asyncio.Future
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype="float32").ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def lookup(self, query_embedding, chunk_ids):
+        """Returns a copy of the best cached answer for this query and context, or None."""
+        context = frozenset(str(chunk_id) for chunk_id in chunk_ids)
+        query = self._normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_similarity = None, self.similarity_threshold
+            for entry_id in list(self._by_context.get(context, ())):
+                entry = self._entries[entry_id]
+                if entry["expires_at"] <= now:
+                    self._drop(entry_id)
+                    continue
+                similarity = float(np.dot(query, entry["query_embedding"]))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return copy.deepcopy(self._entries[best_id]["response"])
+
+    def store(self, query_embedding, chunk_ids, response):
+        context = frozenset(str(chunk_id) for chunk_id in chunk_ids)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "query_embedding": self._normalize(query_embedding),
+                "context": context,
+                "response": copy.deepcopy(response),
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._by_context.setdefault(context, set()).add(entry_id)
+            for chunk_id in context:
+                self._by_chunk.setdefault(chunk_id, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_chunks(self, chunk_ids):
+        """Drops every cached answer that was generated from any of these chunks."""
+        with self._lock:
+            entry_ids = set()
+            for chunk_id in chunk_ids:
+                entry_ids.update(self._by_chunk.get(str(chunk_id), ()))
+            for entry_id in entry_ids:
+                self._drop(entry_id)
+            self.invalidated += len(entry_ids)
+        if entry_ids:
+            logging.debug(f"Invalidated {len(entry_ids)} cached responses.")
+
+    def _drop(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._by_context[entry["context"]].discard(entry_id)
+        if not self._by_context[entry["context"]]:
+            del self._by_context[entry["context"]]
+        for chunk_id in entry["context"]:
+            self._by_chunk[chunk_id].discard(entry_id)
+            if not self._by_chunk[chunk_id]:
+                del self._by_chunk[chunk_id]
+
+    async def get_or_generate(self, user_query, query_embedding, chunk_ids, generate):
+        """
+        Returns a cached answer, joins an identical generation already in
+        flight, or awaits ``generate()`` and caches its result.
+        """
+        cached = self.lookup(query_embedding, chunk_ids)
+        if cached is not None:
+            return cached
+
+        key = (user_query, frozenset(str(chunk_id) for chunk_id in chunk_ids))
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            response = await asyncio.shield(in_flight)
+            if response is LEADER_CANCELLED:
+                # The request generating the answer went away; this one is
+                # still live, so it (or another follower) generates instead
+                return await self.get_or_generate(
+                    user_query, query_embedding, chunk_ids, generate
+                )
+            return copy.deepcopy(response)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await generate()
+        except asyncio.CancelledError:
+            # Followers must not be cancelled along with the leader's request
+            future.set_result(LEADER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody was waiting
+            raise
+        finally:
+            del self._in_flight[key]
+        self.store(query_embedding, chunk_ids, response)
+        future.set_result(response)
+        return copy.deepcopy(response)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "invalidated": self.invalidated,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,159 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+File storage for uploads and their extracted text.
+
+Both backends expose the same small interface: ``put_stream``, ``get_stream``,
+``exists``, ``list`` and ``url``. Names are relative to the configured storage
+root. ``HdfsStorage`` keeps one WebHDFS client with a pooled HTTP session for
+the life of the process; ``LocalStorage`` keeps files in a local directory
+for tests and single-node deployments.
+"""
+import os
+from pathlib import Path
+from urllib.parse import quote
+
+import config
+
+
+class Storage:
+    """Interface of the storage backends."""
+
+    def put_stream(self, name, source):
+        """
+        Writes a file from a readable binary file object, in UPLOAD_BLOCK_SIZE blocks.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        raise NotImplementedError
+
+    def get_stream(self, name):
+        """Returns a context manager yielding a readable binary file object."""
+        raise NotImplementedError
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def list(self, directory=""):
+        """Returns the names of the files in a directory, sorted."""
+        raise NotImplementedError
+
+    def url(self, name):
+        """Returns the URL stored with file metadata to locate a file."""
+        raise NotImplementedError
+
+
+def _copy_blocks(source, writer):
+    size = 0
+    while True:
+        block = source.read(config.UPLOAD_BLOCK_SIZE)
+        if not block:
+            break
+        writer.write(block)
+        size += len(block)
+    return size
+
+
+class HdfsStorage(Storage):
+    """
+    Storage in HDFS through WebHDFS.
+
+    A single client is shared by all requests. Its ``requests`` session keeps
+    up to ``pool_size`` connections per host alive, so uploads reuse
+    connections to the namenode and datanodes instead of opening new ones.
+    """
+
+    def __init__(self, url, user, root, pool_size=16):
+        import requests
+        from hdfs import InsecureClient
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self.base_url = url.rstrip("/")
+        self.root = "/" + root.strip("/")
+        self.client = InsecureClient(self.base_url, user=user, root=self.root, session=session)
+
+    def put_stream(self, name, source):
+        with self.client.write(name, overwrite=True) as writer:
+            return _copy_blocks(source, writer)
+
+    def get_stream(self, name):
+        return self.client.read(name)
+
+    def exists(self, name):
+        return self.client.status(name, strict=False) is not None
+
+    def list(self, directory=""):
+        return sorted(self.client.list(directory))
+
+    def url(self, name):
+        path = quote(f"{self.root}/{name}".replace("//", "/"))
+        return f"{self.base_url}/webhdfs/v1{path}?op=OPEN"
+
+
+class LocalStorage(Storage):
+    """
+    Storage in a local directory.
+
+    Files are written to a temporary name and renamed into place, so readers
+    never see a partial file.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name):
+        path = (self.root / name).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise ValueError(f"Storage name escapes the storage root: {name}")
+        return path
+
+    def put_stream(self, name, source):
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.partial")
+        with open(partial, "wb") as writer:
+            size = _copy_blocks(source, writer)
+        os.replace(partial, path)
+        return size
+
+    def get_stream(self, name):
+        return open(self._path(name), "rb")
+
+    def exists(self, name):
+        return self._path(name).is_file()
+
+    def list(self, directory=""):
+        path = self._path(directory)
+        if not path.is_dir():
+            return []
+        return sorted(
+            entry.name for entry in path.iterdir()
+            if not (entry.name.startswith(".") and entry.name.endswith(".partial"))
+        )
+
+    def url(self, name):
+        return self._path(name).as_uri()
+
+
+def create_storage(backend=None):
+    """Returns the storage backend named by STORAGE_BACKEND ("hdfs" or "local")."""
+    backend = backend or config.STORAGE_BACKEND
+    if backend == "hdfs":
+        return HdfsStorage(
+            config.HDFS_URL,
+            config.HDFS_USER,
+            config.STORAGE_ROOT,
+            pool_size=config.HDFS_POOL_SIZE,
+        )
+    if backend == "local":
+        return LocalStorage(config.LOCAL_STORAGE_DIR)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+storage = create_storage()
@@ -0,0 +1,80 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Deleting an original upload must remove its processed text, chunks and
+vectors, so later searches cannot return them.
+
+Runs against mongomock and local storage in a temporary directory:
+    python -m pytest -q test_delete_cascade.py
+"""
+import io
+import os
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("MONGO_URI", "mongomock://")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("MODEL_WARMUP", "false")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(WORK_DIR, "storage"))
+os.environ.setdefault("INDEX_DIR", os.path.join(WORK_DIR, "index"))
+os.environ.setdefault("EMBEDDING_CACHE_DIR", os.path.join(WORK_DIR, "cache"))
+os.environ.setdefault("INGEST_SPOOL_DIR", os.path.join(WORK_DIR, "spool"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app  # noqa: E402
+
+DOCUMENTS = {
+    "paddington.txt": "Paddington station is run by Network Rail. " * 100,
+    "reading.txt": "Signal SN45 was passed at danger near Reading. " * 100,
+}
+
+
+def wait_for_job(client, job_id, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"Ingestion job {job_id} did not finish")
+
+
+def search(client, query):
+    response = client.post(
+        "/process_documents/batch", json={"user_queries": [query], "top_k": 100}
+    )
+    assert response.status_code == 200
+    return response.json()["results"][0]["chunks"]
+
+
+def test_delete_original_removes_its_chunks_from_search():
+    with TestClient(app.app) as client:
+        jobs = {}
+        for filename, text in DOCUMENTS.items():
+            response = client.post(
+                "/document", files={"file": (filename, io.BytesIO(text.encode()), "text/plain")}
+            )
+            assert response.status_code == 202
+            job = wait_for_job(client, response.json()["job_id"])
+            assert job["status"] == "succeeded"
+            jobs[filename] = job
+
+        deleted = jobs["paddington.txt"]
+        assert any(chunk["document_name"] == "paddington.txt" for chunk in search(client, "Paddington"))
+
+        response = client.delete(f"/files/{deleted['original_file_id']}")
+        assert response.status_code == 200
+        assert response.json()["deleted_chunks"] > 0
+
+        # The processed text went with the original
+        file_ids = {file["_id"] for file in client.get("/files/").json()["files"]}
+        assert deleted["original_file_id"] not in file_ids
+        assert deleted["processed_file_id"] not in file_ids
+        assert app.chunks_collection.count_documents(
+            {"file_id": app.ObjectId(deleted["processed_file_id"])}
+        ) == 0
+
+        chunks = search(client, "Paddington")
+        assert chunks
+        assert all(chunk["document_name"] == "reading.txt" for chunk in chunks)
@@ -0,0 +1,53 @@
+# © 2024 Brian Scanlon. All rights reserved.
+"""
+Graph objects from the LLM that lack required fields are skipped, not
+allowed to fail the request.
+
+    python -m pytest -q test_graph_merge.py
+"""
+import asyncio
+import os
+import tempfile
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("MONGO_URI", "mongomock://")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("MODEL_WARMUP", "false")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(WORK_DIR, "storage"))
+os.environ.setdefault("INDEX_DIR", os.path.join(WORK_DIR, "index"))
+os.environ.setdefault("EMBEDDING_CACHE_DIR", os.path.join(WORK_DIR, "cache"))
+os.environ.setdefault("INGEST_SPOOL_DIR", os.path.join(WORK_DIR, "spool"))
+
+import app  # noqa: E402
+from graph_stream import GraphMerger  # noqa: E402
+
+
+def test_generate_answer_skips_incomplete_node(monkeypatch):
+    async def fake_rag_api(result_chunks, user_query):
+        return {
+            "response": '{"nodes": [{"id": 1, "name": "Network Rail"}, '
+                        '{"id": 2, "name": "Paddington", "category": "Station"}], '
+                        '"links": [{"source_id": 2, "target_id": 2}]}'
+        }
+
+    monkeypatch.setattr(app, "send_to_rag_api", fake_rag_api)
+    answer = asyncio.run(app.generate_answer([], "Who runs Paddington?"))
+    assert answer["nodes"] == [{"id": 2, "name": "Paddington", "category": "Station"}]
+    assert answer["links"] == []
+
+
+def test_malformed_pending_link_does_not_drop_the_others():
+    merger = GraphMerger()
+    # Held back until their nodes arrive; the middle one has no relation
+    merger.pending_links = [
+        {"source_id": 1, "target_id": 2, "relation": "operates"},
+        {"source_id": 1, "target_id": 2},
+        {"source_id": 2, "target_id": 1, "relation": "operated by"},
+    ]
+    merger.add("node", {"id": 1, "name": "Network Rail", "category": "Company"})
+    events = merger.add("node", {"id": 2, "name": "Paddington", "category": "Station"})
+    assert events == [
+        ("node", {"id": 2, "name": "Paddington", "category": "Station"}),
+        ("link", {"source_id": 1, "target_id": 2, "relation": "operates"}),
+        ("link", {"source_id": 2, "target_id": 1, "relation": "operated by"}),
+    ]
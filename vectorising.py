@@ -1,14 +1,75 @@
 # vectorization.py
 # © 2024 Brian Scanlon. All rights reserved.
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
+import logging
+import config
+import models
+from embedding_cache import EmbeddingCache, EmbeddingCacheLocked
 
-# Load the pre-trained embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+
+def open_embedding_cache():
+    """Opens the configured embedding cache, or returns None if it is disabled or in use."""
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return None
+    try:
+        return EmbeddingCache(
+            config.EMBEDDING_CACHE_DIR,
+            config.EMBEDDING_DIMENSION,
+            config.EMBEDDING_CACHE_MAX_ENTRIES,
+        )
+    except EmbeddingCacheLocked as e:
+        # Sharing it would let two processes write the same free row
+        logging.warning(
+            f"{e} Embedding without the cache; give each process its own EMBEDDING_CACHE_DIR."
+        )
+        return None
+
+
+# Cache of previously computed chunk embeddings, keyed by model name and text
+embedding_cache = open_embedding_cache()
 
 def embed_chunks(chunks):
-    """Embeds text chunks using the pre-trained model."""
+    """Embeds text chunks using the shared embedding model, encoding only cache misses."""
     if not chunks:
         return np.array([])  # Return empty array if no chunks
-    return model.encode(chunks)
+    if embedding_cache is None:
+        return models.encode(chunks)
+
+    keys = [EmbeddingCache.key(models.model_key(), chunk) for chunk in chunks]
+    embeddings, missing = embedding_cache.get_many(keys)
+    if missing:
+        # Encode each distinct missing text once, even if it repeats in the batch
+        missing_keys = list(dict.fromkeys(keys[i] for i in missing))
+        texts = {keys[i]: chunks[i] for i in missing}
+        encoded = models.encode([texts[key] for key in missing_keys])
+        embedding_cache.put_many(missing_keys, encoded)
+        rows = dict(zip(missing_keys, encoded))
+        for i in missing:
+            embeddings[i] = rows[keys[i]]
+
+    logging.debug(
+        f"Embedded {len(chunks)} chunks: {len(chunks) - len(missing)} cache hits, "
+        f"{len(missing)} misses. Totals: {embedding_cache.stats()}"
+    )
+    return embeddings
+
+def chunking_options():
+    """
+    Returns the ``chunk_text`` keyword arguments for the configured CHUNKING_MODE.
+
+    In token mode chunks are windows of the embedding model's tokens that fit its
+    maximum sequence length (less the special tokens), so the encoder never
+    truncates them.
+    """
+    if config.CHUNKING_MODE == "words":
+        return {"chunk_size": config.CHUNK_WORD_SIZE}
+    model = models.get_model()
+    window = config.CHUNK_TOKEN_WINDOW or (
+        model.max_seq_length - model.tokenizer.num_special_tokens_to_add()
+    )
+    return {
+        "tokenizer": model.tokenizer,
+        "chunk_size": window,
+        "overlap": config.CHUNK_TOKEN_OVERLAP,
+    }